@@ -0,0 +1 @@
+local ‪ = _G local ‪‪ = ‪['\115\116\114\105\110\103'] local ‪‪‪ = ‪['\98\105\116']['\98\120\111\114'] local ‪‪‪‪‪‪‪‪ = {['\226\128\139']=0,['\226\128\140']=1,['\226\128\141']=2,['\226\128\142']=3,['\226\128\143']=4,['\226\128\170']=5,['\226\128\172']=6,['\226\129\160']=7,['\226\129\161']=8,['\226\129\162']=9,['\226\129\163']=10,['\226\129\164']=11,['\226\129\166']=12,['\226\129\167']=13,['\226\129\168']=14,['\226\129\169']=15} local function ‪‪‪‪‪‪‪(‪‪‪‪) if ‪‪['\108\101\110'](‪‪‪‪) == 0 then return ‪‪‪‪ end local ‪‪‪‪‪ = {} local ‪‪‪‪‪‪ for _ in ‪‪['\103\109\97\116\99\104'](‪‪‪‪,'\46\46\46') do if ‪‪‪‪‪‪ then ‪‪‪‪‪[#‪‪‪‪‪+1] = ‪‪['\99\104\97\114'](‪‪‪(‪‪‪‪‪‪*16+‪‪‪‪‪‪‪‪[_],__XOR__)) ‪‪‪‪‪‪ = nil else ‪‪‪‪‪‪ = ‪‪‪‪‪‪‪‪[_] end end return ‪['\116\97\98\108\101']['\99\111\110\99\97\116'](‪‪‪‪‪) end
\ No newline at end of file
@@ -1,25 +1,27 @@
+import api
 import argparse
+import cache
+import context
+import errors
+import finalize
+import incremental
 import obfuscator
 import json
 import sys
 import stringencoder
+import stringstripper
+import batch
 import os
+import server
 import time
 
 
-rec_version = (3, 4, 3)
+rec_version = (3, 6)
 cur_version = sys.version_info
 
-if cur_version < rec_version:
-    print("WARNING!!! Your Python version is older than 3.4.3")
-    print("The obfuscator may not work correctly!")
-
-
 VERSION = "Beta 1.0.3"
 VERSION_DATE = time.strftime("%b %d, %Y @ %I:%M %p", time.localtime(os.path.getmtime(__file__)))
 
-print("Version: {0} (Updated on {1})".format(VERSION, VERSION_DATE))
-
 
 in_file = "input.lua"
 out_file = "output.lua"
@@ -29,65 +31,184 @@ dontcopy = False
 debug_mode = False
 
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--input',
-                    help='The input file path',
-                    default=in_file)
-parser.add_argument('--output',
-                    help='The output file path',
-                    default=out_file)
-parser.add_argument("--level",
-                    help='0 = original strings, 1 = small file, 2 = large file, 3 = huge file',
-                    default=1)
-parser.add_argument("--dontcopy",
-                    help='Disable copying the output',
-                    action='store_true')
-parser.add_argument("--debug",
-                    help="Enable debug mode",
-                    action='store_true')
-args = parser.parse_args()
-
-
-in_file = args.input
-out_file = args.output
-encoder = stringencoder.get_by_level(int(args.level))
-dontcopy = args.dontcopy
-debug_mode = args.debug
-
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--input',
+                        help='The input file path',
+                        default=in_file)
+    parser.add_argument('--output',
+                        help='The output file path',
+                        default=out_file)
+    parser.add_argument('--input-dir',
+                        help='Obfuscate every file in this directory (and below) instead of --input')
+    parser.add_argument('--output-dir',
+                        help='Where to write the files from --input-dir, keeping the same layout')
+    parser.add_argument('--pattern',
+                        help='Which files in --input-dir to obfuscate',
+                        default="*.lua")
+    parser.add_argument('--jobs',
+                        help='How many files to obfuscate at once with --input-dir (default: 1 per CPU)',
+                        type=int,
+                        default=None)
+    parser.add_argument('--parallel',
+                        help='Rewrite parts of one big file on this many processes (not with --input-dir)',
+                        type=int,
+                        default=1)
+    parser.add_argument("--level",
+                        help='0 = original strings, 1 = small file, 2 = large file, 3 = huge file, 4 = invisible strings, 6x input',
+                        default=1)
+    parser.add_argument("--dontcopy",
+                        help='Disable copying the output',
+                        action='store_true')
+    parser.add_argument("--debug",
+                        help="Enable debug mode",
+                        action='store_true')
+    parser.add_argument("--profile",
+                        help="Write how long every stage took (and its token counts) to this JSON file")
+    parser.add_argument("--cprofile",
+                        help="Write a cProfile dump of the obfuscation to this file (not with --input-dir)")
+    parser.add_argument("--incremental",
+                        help="Keep the XOR and names of every file in this directory and reuse them next time, "
+                             "so unchanged code comes out the same",
+                        metavar="STATE_DIR")
+    parser.add_argument("--server",
+                        help="Keep running and obfuscate JSON requests read from stdin, one per line (see server.py)",
+                        action='store_true')
+    parser.add_argument("--no-cache",
+                        help="Always obfuscate, without reading or writing the output cache",
+                        action='store_true')
+    parser.add_argument("--cache-dir",
+                        help="Where the output cache is kept",
+                        default=cache.DEFAULT_DIR)
+    parser.add_argument("--cache-size",
+                        help="Largest size of the output cache in MB",
+                        type=int,
+                        default=cache.DEFAULT_MAX_BYTES // (1024 * 1024))
+    args = parser.parse_args()
+
+    if args.input_dir is not None and args.output_dir is None:
+        parser.error("--input-dir requires --output-dir")
+
+    return args
+
+
+def main():
+    args = parse_args()
+
+    # stdout is for the responses in server mode
+    info = sys.stderr if args.server else sys.stdout
+
+    if cur_version < rec_version:
+        print("WARNING!!! Your Python version is older than 3.6", file=info)
+        print("The obfuscator may not work correctly!", file=info)
+
+    print("Version: {0} (Updated on {1})".format(VERSION, VERSION_DATE), file=info)
+
+    in_file = args.input
+    out_file = args.output
+    level = int(args.level)
+    dontcopy = args.dontcopy
+    debug_mode = args.debug
+
+    # The globals.json in the working directory, or the one that comes with the obfuscator
+    globs = api.load_globals(global_file if os.path.exists(global_file) else api.GLOBALS_FILE)
+
+    output_cache = None
+    if not args.no_cache:
+        output_cache = cache.OutputCache(args.cache_dir, args.cache_size * 1024 * 1024)
+
+    if args.server:
+        server.serve(sys.stdin, sys.stdout, output_cache, globs)
+        return
+
+    if args.input_dir is not None:
+        start_time = time.time()
+        results = batch.obfuscate_tree(args.input_dir, args.output_dir, level, globs,
+                                       args.jobs, args.pattern, debug_mode, output_cache, args.incremental)
+        batch.print_summary(results, time.time() - start_time)
+
+        if args.profile is not None:
+            write_profile(args.profile, {r.path: r.stats for r in results})
+
+        exit(1 if any(not r.ok for r in results) else 0)
+
+    encoder = stringencoder.get_by_level(level)
+
+    lua = None
+    state = None
+    state_path = None
+    if args.incremental is not None:
+        state_path = incremental.file_state_path(args.incremental, in_file)
+        state = incremental.load_state(state_path)
+        ctx = incremental.new_context(state, debug_mode)
+    else:
+        ctx = context.ObfuscationContext(debug_mode)
+    ctx.jobs = args.parallel
+    profiler = None
 
-lua = None
-decrypt = None
-globs = None
+    try:
+        lua = stringstripper.read_source(in_file)
+
+        if args.cprofile is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        # Do the obfuscation and write the results
+        with finalize.open_output(out_file) as f:
+            # Stream the code to the file, unless it is copied to the clipboard too
+            sink = f if dontcopy else None
+
+            if state is not None:
+                lua = incremental.obfuscate(lua, encoder, globs, state, debug_mode, ctx, output_cache, sink)
+            elif output_cache is not None:
+                lua = output_cache.obfuscate(lua, encoder, globs, debug_mode, ctx=ctx, sink=sink)
+            else:
+                lua = obfuscator.obfuscate(lua, encoder, globs, debug_mode, ctx=ctx, sink=sink)[0]
+
+            if lua is not None:
+                f.write(lua.encode("utf-8"))
+
+    except errors.ObfuscationError as e:
+        if debug_mode:
+            raise
+        print("Error!!! {0}".format(e))
+        exit(1)
 
+    except:
+        if not debug_mode:
+            print("Fatal error occurred.")
+            exit(1)
+        else:
+            raise
 
-try:
-    with open(in_file, "rb") as f:
-        lua = f.read().decode("utf-8")
 
-    with open(global_file, "r") as f:
-        globs = json.loads(f.read())
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(args.cprofile)
+        print("cProfile dump written to {0}.".format(args.cprofile))
 
+    if args.profile is not None:
+        print(ctx.stats.format())
+        write_profile(args.profile, ctx.stats.to_dict())
 
-    # Do the obfuscation
-    lua, tokens, strings, comments = obfuscator.obfuscate(lua, encoder, globs, debug_mode)
+    if not dontcopy:
+        try:
+            import pyperclip
+            pyperclip.copy(lua)
+            print("Code copied to clipboard.")
+        except:
+            pass
 
-except:
-    if not debug_mode:
-        print("Fatal error occurred.")
-        exit(0)
-    else:
-        raise
+    if state is not None:
+        incremental.save_state(state_path, state)
 
 
-if not dontcopy:
-    try:
-        import pyperclip
-        pyperclip.copy(lua)
-        print("Code copied to clipboard.")
-    except:
-        pass
+def write_profile(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    print("Profile written to {0}.".format(path))
 
 
-# Write the results
-with open(out_file, "wb") as f:
-    f.write(lua.encode("utf-8"))
\ No newline at end of file
+if __name__ == "__main__":
+    main()
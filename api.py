@@ -0,0 +1,130 @@
+"""
+Obfuscating from Python, without the command line
+
+    import api
+    result = api.obfuscate_source(lua, api.Options(level=2))
+    print(result.code)
+
+Nothing is printed and nothing exits, input that can not be
+obfuscated raises an errors.ObfuscationError.
+"""
+
+import json
+import os
+
+import context
+import errors
+import incremental
+import obfuscator
+import stringencoder
+
+
+LEVELS = (0, 1, 2, 3, 4)
+
+GLOBALS_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "globals.json")
+
+# Path -> global names, see load_globals
+_globals = {}
+
+
+class Options:
+    """
+    How to obfuscate, everything is optional
+    """
+
+    __slots__ = ("level", "xor", "seed", "globs", "cache", "state", "jobs")
+
+    def __init__(self, level=1, xor=-1, seed=None, globs=None, cache=None, state=None, jobs=1):
+        # Encoder level, see the README
+        self.level = level
+
+        # -1 for a random one
+        self.xor = xor
+
+        # None for a random run, the same seed and input always give the same output
+        self.seed = seed
+
+        # Known global names, the ones in globals.json by default
+        self.globs = globs
+
+        # An OutputCache to take the output from (and put it in)
+        self.cache = cache
+
+        # An incremental.FileState to obfuscate with, it is updated afterwards.
+        # Its XOR and seed are used instead of the ones above.
+        self.state = state
+
+        # Processes to rewrite the source with, only worth it for big files (see parallel.py)
+        self.jobs = jobs
+
+
+class Result:
+    """
+    The obfuscated code, and how long each stage took (a RunStats)
+    """
+
+    __slots__ = ("code", "stats", "cached")
+
+    def __init__(self, code, stats, cached=False):
+        self.code = code
+        self.stats = stats
+
+        # The code came from the cache
+        self.cached = cached
+
+
+def load_globals(path=GLOBALS_FILE):
+    """
+    The global names in a globals.json as a frozenset, only read once per process
+    """
+
+    globs = _globals.get(path)
+    if globs is None:
+        with open(path, "r") as f:
+            globs = frozenset(json.loads(f.read()))
+        _globals[path] = globs
+    return globs
+
+
+def obfuscate_source(source, options=None):
+    """
+    Obfuscates Lua source code
+    :raises ValueError: If the level does not exist
+    :raises errors.ObfuscationError: If the source can not be obfuscated, a StripError or ParseError
+                                     when the problem is known, an ObfuscationError wrapping the real one otherwise
+    :return: Result
+    """
+
+    if options is None:
+        options = Options()
+    if options.level not in LEVELS:
+        raise ValueError("Unknown level {0}, the levels are {1}".format(options.level, LEVELS))
+
+    globs = options.globs if options.globs is not None else load_globals()
+    encoder = stringencoder.get_by_level(options.level, warn=False)
+    cache = options.cache
+    state = options.state
+
+    if state is not None:
+        ctx = incremental.new_context(state)
+        ctx.quiet = True
+    else:
+        ctx = context.ObfuscationContext(seed=options.seed, quiet=True)
+    ctx.jobs = options.jobs
+
+    hits = cache.hits if cache is not None else 0
+
+    try:
+        if state is not None:
+            code = incremental.obfuscate(source, encoder, globs, state, ctx=ctx, cache=cache)
+        elif cache is not None:
+            code = cache.obfuscate(source, encoder, globs, xor_val=options.xor, ctx=ctx)
+        else:
+            code = obfuscator.obfuscate(source, encoder, globs, xor_val=options.xor, ctx=ctx)[0]
+    except errors.ObfuscationError:
+        raise
+    except Exception as e:
+        # Invalid input the passes do not check for ends up here
+        raise errors.ObfuscationError("Could not obfuscate the source ({0}: {1})".format(type(e).__name__, e)) from e
+
+    return Result(code, ctx.stats, cache is not None and cache.hits > hits)
@@ -0,0 +1,190 @@
+import concurrent.futures
+import contextlib
+import fnmatch
+import io
+import os
+import shutil
+import time
+
+import context
+import finalize
+import incremental
+import obfuscator
+import stringencoder
+import stringstripper
+
+
+class FileResult:
+    """
+    The outcome of obfuscating a single file in a batch
+    """
+
+    __slots__ = ("path", "ok", "seconds", "message", "stats", "cached")
+
+    def __init__(self, path, ok, seconds, message="", stats=None, cached=False):
+        self.path = path
+        self.ok = ok
+        self.seconds = seconds
+        self.message = message
+
+        # The output came from the cache
+        self.cached = cached
+
+        # RunStats.to_dict() of the run, if it got that far
+        self.stats = stats
+
+
+def find_files(input_dir, pattern="*.lua"):
+    """
+    Finds every file below input_dir with a name matching the pattern
+    :return: Sorted paths relative to input_dir
+    """
+
+    found = []
+    for root, dirs, files in os.walk(input_dir):
+        dirs.sort()
+        for name in files:
+            if fnmatch.fnmatch(name, pattern):
+                found.append(os.path.relpath(os.path.join(root, name), input_dir))
+    found.sort()
+    return found
+
+
+def obfuscate_file(in_path, out_path, level, globs, debug=False, cache=None, state_path=None):
+    """
+    Obfuscates one file. Never raises, so one bad file can not stop a batch.
+    The obfuscator's own output is only shown in debug mode.
+    The output comes from (and goes to) the cache if one is given.
+    With a state_path the file is obfuscated incrementally (see incremental.py).
+    :return: FileResult
+    """
+
+    start_time = time.time()
+    output = io.StringIO()
+
+    state = None
+    if state_path is not None:
+        state = incremental.load_state(state_path)
+        ctx = incremental.new_context(state, debug)
+    else:
+        ctx = context.ObfuscationContext(debug)
+
+    try:
+        with contextlib.redirect_stdout(output):
+            lua = stringstripper.read_source(in_path)
+
+            encoder = stringencoder.get_by_level(level)
+
+            # The code is streamed to the file, never held as a whole
+            with finalize.open_output(out_path) as sink:
+                if state is not None:
+                    incremental.obfuscate(lua, encoder, globs, state, debug, ctx, cache, sink)
+                elif cache is not None:
+                    cache.obfuscate(lua, encoder, globs, debug, ctx=ctx, sink=sink)
+                else:
+                    obfuscator.obfuscate(lua, encoder, globs, debug, ctx=ctx, sink=sink)
+
+        if state is not None:
+            incremental.save_state(state_path, state)
+
+    except Exception as e:
+        message = str(e)
+
+        if debug:
+            message = output.getvalue() + message
+        return FileResult(in_path, False, time.time() - start_time, message or type(e).__name__)
+
+    return FileResult(in_path, True, time.time() - start_time, output.getvalue() if debug else "",
+                      ctx.stats.to_dict())
+
+
+def obfuscate_tree(input_dir, output_dir, level, globs, jobs=None, pattern="*.lua", debug=False, cache=None,
+                   state_dir=None):
+    """
+    Obfuscates every matching file below input_dir into the same layout below output_dir,
+    using a pool of jobs processes (one per CPU by default).
+    With a cache, files that are in it are copied out first and only the rest go to the pool.
+    With a state_dir every file is obfuscated incrementally, its state kept in the same layout below state_dir.
+    Prints the status of each file as it finishes.
+    :return: [FileResult] in the order the files finished
+    """
+
+    paths = find_files(input_dir, pattern)
+    tasks = [(os.path.join(input_dir, p), os.path.join(output_dir, p), level, globs, debug, cache,
+              None if state_dir is None else incremental.state_path(state_dir, p)) for p in paths]
+
+    results = []
+
+    if cache is not None:
+        missed = []
+        for task in tasks:
+            result = _from_cache(*task)
+            if result is None:
+                missed.append(task)
+            else:
+                results.append(_report(result))
+        tasks = missed
+
+    if not tasks:
+        return results
+
+    if jobs == 1:
+        for task in tasks:
+            results.append(_report(obfuscate_file(*task)))
+        return results
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = {pool.submit(obfuscate_file, *task): task[0] for task in tasks}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # The worker itself died
+                result = FileResult(futures[future], False, 0, str(e) or type(e).__name__)
+            results.append(_report(result))
+
+    return results
+
+
+def _from_cache(in_path, out_path, level, globs, debug, cache, state_path):
+    """
+    Writes the cached output of the file, if there is one
+    :return: FileResult, or None if it has to be obfuscated
+    """
+
+    start_time = time.time()
+    try:
+        lua = stringstripper.read_source(in_path)
+
+        if state_path is not None:
+            key = incremental.cache_key(cache, lua, level, globs, incremental.load_state(state_path))
+        else:
+            key = cache.key(lua, level, globs)
+
+        f = cache.open(key)
+        if f is None:
+            return None
+        with f, finalize.open_output(out_path) as sink:
+            shutil.copyfileobj(f, sink)
+    except Exception:
+        # Let obfuscate_file report it
+        return None
+
+    return FileResult(in_path, True, time.time() - start_time, cached=True)
+
+
+def print_summary(results, seconds):
+    failed = [r for r in results if not r.ok]
+
+    print("Obfuscated {0} of {1} files in {2:.3f} seconds.".format(len(results) - len(failed), len(results), seconds))
+    for r in failed:
+        print("\tFAILED {0}".format(r.path))
+
+
+def _report(result):
+    if result.ok:
+        print("[ OK ] {0} ({1:.3f}s{2})".format(result.path, result.seconds,
+                                                ", cached" if result.cached else ""))
+    else:
+        print("[FAIL] {0}: {1}".format(result.path, result.message))
+    return result
@@ -0,0 +1,177 @@
+"""
+Benchmarks obfuscate() on synthetic sources of several sizes, with every encoder level.
+
+    python bench/bench.py                        run everything, compare with bench/baseline.json
+    python bench/bench.py --sizes 10k,100k       only some sizes
+    python bench/bench.py --save-baseline        make this run the new baseline
+
+Each case records the time of every stage (from ctx.stats) and the peak memory
+of a second run under tracemalloc (skipped with --no-memory, tracemalloc slows things down).
+Cases that got slower (or bigger) than the baseline by more than --threshold are reported,
+and the exit code is 1 if there were any.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import api
+import context
+import obfuscator
+import stringencoder
+import generate
+
+
+LEVELS = [0, 1, 2, 3, 4]
+SEED = 1234
+XOR = 77
+
+DEFAULT_BASELINE = os.path.join(ROOT, "bench", "baseline.json")
+
+
+def run_case(lua, level, globs, memory=True):
+    """
+    Obfuscates lua once for the timings and once more under tracemalloc for the peak memory
+    """
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        encoder = stringencoder.get_by_level(level)
+
+    ctx = context.ObfuscationContext(seed=SEED)
+    start_time = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        out = obfuscator.obfuscate(lua, encoder, globs, xor_val=XOR, ctx=ctx)[0]
+    seconds = time.perf_counter() - start_time
+
+    result = {
+        "seconds": seconds,
+        "input_bytes": len(lua.encode("utf-8")),
+        "output_bytes": len(out.encode("utf-8")),
+        "stages": {stage.name: stage.seconds for stage in ctx.stats.stages},
+        "peak_bytes": None,
+    }
+    del out
+
+    if memory:
+        tracemalloc.start()
+        with contextlib.redirect_stdout(io.StringIO()):
+            obfuscator.obfuscate(lua, encoder, globs, xor_val=XOR, ctx=context.ObfuscationContext(seed=SEED))
+        result["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return result
+
+
+def compare(results, baseline, threshold):
+    """
+    Prints how every case changed compared to the baseline
+    :return: Names of the cases (and stages) that regressed
+    """
+
+    regressions = []
+    print()
+    print("{0:<10} {1:>10} {2:>10} {3:>8} {4:>12} {5:>12} {6:>8}".format(
+        "Case", "Base s", "Now s", "Change", "Base peak", "Now peak", "Change"))
+
+    for name, now in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print("{0:<10} {1:>10} {2:>10.3f}".format(name, "-", now["seconds"]))
+            continue
+
+        time_change = _change(base["seconds"], now["seconds"])
+        peak_change = _change(base.get("peak_bytes"), now.get("peak_bytes"))
+
+        print("{0:<10} {1:>10.3f} {2:>10.3f} {3:>8} {4:>12} {5:>12} {6:>8}".format(
+            name, base["seconds"], now["seconds"], _format_change(time_change),
+            base.get("peak_bytes") or "-", now.get("peak_bytes") or "-", _format_change(peak_change)))
+
+        # Ignore runs too quick to time reliably
+        if time_change is not None and time_change > threshold and now["seconds"] > 0.1:
+            regressions.append(name)
+        if peak_change is not None and peak_change > threshold:
+            regressions.append(name + " (memory)")
+
+        for stage, seconds in now["stages"].items():
+            base_seconds = base["stages"].get(stage)
+            change = _change(base_seconds, seconds)
+            if change is not None and change > threshold and seconds > 0.05:
+                print("    {0} {1:.4f}s -> {2:.4f}s ({3})".format(stage, base_seconds, seconds, _format_change(change)))
+                regressions.append("{0} {1}".format(name, stage))
+
+    return regressions
+
+
+def _change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before
+
+
+def _format_change(change):
+    if change is None:
+        return "-"
+    return "{0:+.1f}%".format(change * 100)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the obfuscator")
+    parser.add_argument("--sizes", default=",".join(generate.SIZES),
+                        help="Comma separated sizes to run (" + ", ".join(generate.SIZES) + ")")
+    parser.add_argument("--levels", default=",".join(str(l) for l in LEVELS),
+                        help="Comma separated encoder levels to run")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE,
+                        help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="Save the results as the new baseline")
+    parser.add_argument("--output", help="Also write the results to this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="How much slower (0.25 = 25%%) counts as a regression")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="Skip the tracemalloc run")
+    args = parser.parse_args()
+
+    globs = api.load_globals()
+
+    results = {}
+    for size in args.sizes.split(","):
+        lua = generate.generate(generate.SIZES[size])
+        for level in args.levels.split(","):
+            name = "{0}:L{1}".format(size, level)
+            result = run_case(lua, int(level), globs, not args.no_memory)
+            results[name] = result
+            print("{0:<10} {1:>9.3f}s  peak {2:>12}  {3} -> {4} bytes".format(
+                name, result["seconds"], result["peak_bytes"] or "-", result["input_bytes"], result["output_bytes"]))
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Baseline saved to {0}.".format(args.baseline))
+
+    if regressions:
+        print()
+        print("Regressions:")
+        for r in regressions:
+            print("\t" + r)
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
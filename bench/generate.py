@@ -0,0 +1,146 @@
+"""
+Generates synthetic (but valid) Lua sources for the benchmarks.
+
+The code is made of "modules" that use every feature the obfuscator
+rewrites: strings, nested tables, method calls (a:b()), closures,
+numeric and generic for loops, while and repeat loops.
+Modules are numbered so their globals do not clash, and they are added
+until the source reaches the requested size.
+"""
+
+import argparse
+import random
+
+
+SIZES = {
+    "10k": 10 * 1024,
+    "100k": 100 * 1024,
+    "1m": 1024 * 1024,
+    "10m": 10 * 1024 * 1024,
+}
+
+WORDS = ["alpha", "beta", "gamma", "delta", "health", "armor", "speed", "model",
+         "color", "name", "owner", "target", "weapon", "score", "team", "pos"]
+
+MESSAGES = ["Hello, world!", "You can not do that right now.", "Round starting in %d seconds",
+            "models/props_c17/oildrum001.mdl", "sound/ambient/alarms/klaxon1.wav",
+            "It's a \"quoted\" string", "line one\nline two", "{player} joined the game"]
+
+
+def generate(size, seed=0):
+    """
+    :return: Lua source of at least size bytes (utf-8)
+    """
+
+    rng = random.Random(seed)
+    parts = []
+    total = 0
+    index = 0
+    while total < size:
+        module = _module(rng, index)
+        parts.append(module)
+        total += len(module.encode("utf-8"))
+        index += 1
+    return "".join(parts)
+
+
+def _module(rng, i):
+    word = rng.choice(WORDS)
+    msg = _quote(rng.choice(MESSAGES), '"')
+    other = _quote(rng.choice(MESSAGES), "'")
+    n = rng.randint(2, 9)
+
+    return """-- Module {i}
+Module{i} = Module{i} or {{}}
+local M = Module{i}
+M.config = {{
+    {word} = {n},
+    label = {msg},
+    nested = {{ inner = {{ depth = {n}, tags = {{ "a", "b"; "c" }} }}, [{n}] = '{word}' }},
+    list = {{ 1, 2, 3, 4.5, 0x1F }},
+}}
+
+--[[ Block comment for module {i}
+     that spans a couple of lines ]]
+function M:Init(ply, opts)
+    self.ply = ply
+    self.opts = opts or {{}}
+    self.count = 0
+    local total, step = {n}, 1
+    for k = 1, total, step do
+        self.count = self.count + k
+    end
+    for key, value in pairs(self.config) do
+        if type(value) == "table" then
+            self.opts[key] = #value
+        elseif key ~= "label" then
+            self.opts[key] = value
+        else
+            self.opts[key] = tostring(value) .. "{word}"
+        end
+    end
+    return self.count
+end
+
+function M:MakeCounter(start)
+    local value = start or 0
+    local function bump(by)
+        value = value + (by or 1)
+        return value
+    end
+    return function(times)
+        for _ = 1, times do
+            bump()
+        end
+        return value, self:Describe()
+    end
+end
+
+function M:Describe()
+    return string.format("%s: %d", self.config.label, self.count or 0)
+end
+
+function M.Static(a, b, ...)
+    local args = {{ ... }}
+    local result = a .. [[long {word} string]] .. b
+    local j = 0
+    while j < #args do
+        j = j + 1
+        result = result .. tostring(args[j])
+    end
+    repeat
+        j = j - 1
+    until j <= 0
+    return result
+end
+
+hook.Add("Think", "Module{i}Think", function()
+    local ply = LocalPlayer()
+    if not IsValid(ply) then return end
+    local pos = ply:GetPos()
+    ply:SetNWInt("{word}", ply:GetNWInt("{word}", 0) + 1)
+    M:Init(ply, {{ speed = pos.x, [ "{word}" ] = {other} }})
+    print(M:Describe(), M.Static("{word}", 'x', 1, 2, 3))
+end)
+
+""".format(i=i, word=word, msg=msg, other=other, n=n)
+
+
+def _quote(s, q):
+    return q + s.replace("\\", "\\\\").replace("\n", "\\n").replace(q, "\\" + q) + q
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write a synthetic Lua source")
+    parser.add_argument("size", help="One of " + ", ".join(SIZES) + ", or a number of bytes")
+    parser.add_argument("output", help="Where to write the source")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    size = SIZES[args.size] if args.size in SIZES else int(args.size)
+    with open(args.output, "wb") as f:
+        f.write(generate(size, args.seed).encode("utf-8"))
+
+
+if __name__ == "__main__":
+    main()
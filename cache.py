@@ -0,0 +1,284 @@
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import shutil
+
+import context
+import finalize
+import obfuscator
+
+
+DEFAULT_DIR = os.path.join(os.path.expanduser("~"), ".cache", "LuaObfuscator")
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+# Files whose contents decide the output, besides the input itself
+_CODE_DIR = os.path.dirname(os.path.abspath(__file__))
+_CODE_PATTERNS = ("*.py", "__decrypt_*.lua")
+
+_code_digest = None
+
+# Frozen set of globals -> its digest, the same globals are used for every file
+_globs_digests = {}
+
+
+def code_digest():
+    """
+    A hash of the obfuscator's own code and decrypt templates,
+    so a new version never gets the output of an old one
+    """
+
+    global _code_digest
+    if _code_digest is None:
+        h = hashlib.sha256()
+        for pattern in _CODE_PATTERNS:
+            for path in sorted(glob.glob(os.path.join(_CODE_DIR, pattern))):
+                with open(path, "rb") as f:
+                    data = f.read()
+                h.update(os.path.basename(path).encode("utf-8"))
+                h.update(len(data).to_bytes(8, "big"))
+                h.update(data)
+        _code_digest = h.hexdigest()
+    return _code_digest
+
+
+def globs_digest(globs):
+    """
+    A hash of the global names, order does not matter.
+    Only worked out once for a frozenset.
+    """
+
+    if isinstance(globs, frozenset):
+        digest = _globs_digests.get(globs)
+        if digest is None:
+            digest = _globs_digests[globs] = _hash_globs(globs)
+        return digest
+    return _hash_globs(globs)
+
+
+def _hash_globs(globs):
+    return hashlib.sha256(json.dumps(sorted(set(globs))).encode("utf-8")).hexdigest()
+
+
+class OutputCache:
+    """
+    Obfuscated code on disk, keyed by a hash of everything that goes into it:
+    the source, encoder level, XOR, seed, globals and the obfuscator's code.
+    Entries are plain files, the least recently used are removed once
+    the cache is bigger than max_bytes.
+
+    A random XOR or seed (-1 / None) is part of the key like any other value,
+    so a hit returns the output of an earlier random run.
+
+    Writes go through a temporary file, so several processes can share a cache.
+    """
+
+    def __init__(self, directory=DEFAULT_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        # Size of the entries, counted on the first put
+        self._size = None
+
+    def key(self, lua, level, globs, xor_val=-1, seed=None):
+        h = hashlib.sha256()
+        for part in (code_digest(), str(level), str(xor_val), repr(seed), globs_digest(globs), lua):
+            data = part.encode("utf-8")
+            h.update(len(data).to_bytes(8, "big"))
+            h.update(data)
+        return h.hexdigest()
+
+    def get(self, key):
+        """
+        :return: The cached code, or None
+        """
+
+        f = self.open(key)
+        if f is None:
+            return None
+        with f:
+            return f.read().decode("utf-8")
+
+    def open(self, key):
+        """
+        :return: The cached code as a binary file to read, or None
+        """
+
+        path = self._path(key)
+        f = None
+        try:
+            f = open(path, "rb")
+            # The modified time is the last use
+            os.utime(path)
+        except OSError:
+            # Missing, or evicted by another process
+            if f is not None:
+                f.close()
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return f
+
+    def put(self, key, lua):
+        with self.writer(key) as f:
+            f.write(lua.encode("utf-8"))
+
+    @contextlib.contextmanager
+    def writer(self, key, also=None):
+        """
+        A binary file to write the code for key to.
+        It only becomes an entry if the with block finishes without an error.
+        :param also: A binary file everything is written to as well, so the code never
+                     has to be read back from the entry (which another process may evict first)
+        """
+
+        path = self._path(key)
+        with finalize.open_output(path) as f:
+            yield f if also is None else _Tee(f, also)
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += os.path.getsize(path)
+
+        if self._size > self.max_bytes:
+            # Never the entry that was just written, it may be read right after
+            self.evict(keep=path)
+
+    def move(self, key, new_key):
+        """
+        Files the entry for key under new_key instead
+        """
+
+        if key != new_key:
+            try:
+                os.replace(self._path(key), self._path(new_key))
+            except OSError:
+                # Evicted by another process, it is only missing from the cache
+                pass
+
+    def copy_to(self, key, sink):
+        """
+        Writes the entry for key to a binary sink
+        :return: If it was in the cache
+        """
+
+        f = self.open(key)
+        if f is None:
+            return False
+        with f:
+            shutil.copyfileobj(f, sink)
+        return True
+
+    def evict(self, max_bytes=None, keep=None):
+        """
+        Removes the least recently used entries until the cache is
+        under max_bytes (90% of self.max_bytes by default, so this does not run on every put)
+        :param keep: Path of an entry not to remove
+        """
+
+        if max_bytes is None:
+            max_bytes = self.max_bytes * 9 // 10
+
+        entries = self._entries()
+        total = sum(size for path, size, used in entries)
+        entries.sort(key=lambda e: e[2])
+
+        for path, size, used in entries:
+            if total <= max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
+
+        self._size = total
+
+    def size(self):
+        return sum(size for path, size, used in self._entries())
+
+    def clear(self):
+        self.evict(0)
+
+    def obfuscate(self, lua, encoder, globs, debug=False, xor_val=-1, ctx=None, sink=None):
+        """
+        obfuscator.obfuscate, but only returns the code,
+        which comes from the cache if this input was obfuscated before.
+        ctx.stats has a single "cache" stage on a hit.
+        :param sink: A binary file to stream the code to instead, None is returned
+        """
+
+        if ctx is None:
+            ctx = context.ObfuscationContext(debug)
+
+        ctx.stats.begin("cache")
+        key = self.key(lua, encoder.level, globs, xor_val, ctx.seed)
+        if sink is not None:
+            cached = None
+            hit = self.copy_to(key, sink)
+        else:
+            cached = self.get(key)
+            hit = cached is not None
+        ctx.stats.end()
+
+        if hit:
+            ctx.log("Loaded from cache.", False)
+            return cached
+
+        if sink is None:
+            lua = obfuscator.obfuscate(lua, encoder, globs, debug, xor_val, ctx)[0]
+            self.put(key, lua)
+            return lua
+
+        with self.writer(key, sink) as f:
+            obfuscator.obfuscate(lua, encoder, globs, debug, xor_val, ctx, f)
+        return None
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + ".lua")
+
+    def _entries(self):
+        """
+        :return: [(path, size, last used)] of every entry
+        """
+
+        entries = []
+        try:
+            with os.scandir(self.directory) as it:
+                for e in it:
+                    if not e.name.endswith(".lua"):
+                        continue
+                    try:
+                        st = e.stat()
+                    except OSError:
+                        continue
+                    entries.append((e.path, st.st_size, st.st_mtime))
+        except OSError:
+            pass
+        return entries
+
+
+class _Tee:
+    """
+    Writes to two binary files at once
+    """
+
+    def __init__(self, first, second):
+        self.first = first
+        self.second = second
+
+    def write(self, data):
+        self.first.write(data)
+        self.second.write(data)
+        return len(data)
+
+    def writelines(self, lines):
+        for line in lines:
+            self.write(line)
@@ -0,0 +1,322 @@
+"""
+Turns a syntax tree back into tokens, rewriting it on the way
+(what used to be one pass over the tokens for each rewrite):
+
+    function a:b(c) end  ->  a.b = function(self, c) end
+    local function f()   ->  local f f = function()
+    a:b(c)               ->  a.b(a, c)
+    a.b                  ->  a[[[b]]]
+    { a = 1 }            ->  { [[[a]]] = 1 }
+    f"s", f{t}           ->  f("s"), f({t})
+
+Names and keywords are the tokens the tree was parsed from, so the
+scope passes can still rename them. Strings are placeholders in strings.
+"""
+
+import syntax
+import tokenizer
+
+
+# The helper a method is called through when its receiver is more than a name, see Generator.visit_Method
+METHOD_CALL = "__METHOD_CALL__"
+
+# Nodes that are a suffix on the value before them, see Generator.visit_Field
+SUFFIXES = (syntax.Field, syntax.Index, syntax.Call, syntax.Method)
+
+
+def generate(tree, strings):
+    """
+    :return: Tokens, strings (with the placeholders made for names)
+    """
+
+    generator = Generator(strings)
+    generator.visit(tree)
+    return generator.out, strings
+
+
+class Generator(syntax.Visitor):
+    """
+    One walk over the tree, every rewrite is done where its node is visited
+    """
+
+    def __init__(self, strings):
+        self.strings = strings
+        self.out = []
+
+    def emit(self, t):
+        self.out.append(t)
+
+    def symbol(self, text, near):
+        self.out.append(tokenizer.Token(tokenizer.SYMBOL, text, near.line, near.column))
+
+    def string(self, codename, value, near):
+        self.strings[codename] = value
+        self.out.append(tokenizer.token(codename, tokenizer.STRING, near))
+
+    def label(self, name):
+        # Labels are not variables, so the global passes must leave them alone
+        self.out.append(tokenizer.token(name.text, tokenizer.INTERNAL, name))
+
+    def emit_list(self, nodes, near):
+        for n, node in enumerate(nodes):
+            if n > 0:
+                self.symbol(",", near)
+            self.visit(node)
+
+    def emit_names(self, names):
+        for n, name in enumerate(names):
+            if n > 0:
+                self.symbol(",", name)
+            self.emit(name)
+
+    # Statements
+
+    def visit_Block(self, node):
+        for statement in node.body:
+            self.visit(statement)
+
+    def visit_Local(self, node):
+        self.emit(node.token)
+        self.emit_names(node.names)
+        if node.values:
+            self.symbol("=", node.token)
+            self.emit_list(node.values, node.token)
+
+    def visit_LocalFunction(self, node):
+        # Declared first so the function can still call itself
+        self.emit(node.token)
+        self.emit(node.name.copy())
+        self.emit(node.name)
+        self.symbol("=", node.name)
+        self.visit(node.func)
+
+    def visit_FunctionStatement(self, node):
+        self.visit(node.target)
+        self.symbol("=", node.func.token)
+        self.emit_function(node.func, node.method)
+
+    def visit_Assign(self, node):
+        self.emit_list(node.targets, node.token)
+        self.emit(node.token)
+        self.emit_list(node.values, node.token)
+
+    def visit_CallStatement(self, node):
+        self.visit(node.call)
+
+    def visit_Do(self, node):
+        self.emit(node.token)
+        self.visit(node.body)
+        self.emit(node.end)
+
+    def visit_While(self, node):
+        self.emit(node.token)
+        self.visit(node.condition)
+        self.emit(node.do)
+        self.visit(node.body)
+        self.emit(node.end)
+
+    def visit_Repeat(self, node):
+        self.emit(node.token)
+        self.visit(node.body)
+        self.emit(node.until)
+        self.visit(node.condition)
+
+    def visit_If(self, node):
+        for keyword, condition, then, body in node.clauses:
+            self.emit(keyword)
+            self.visit(condition)
+            self.emit(then)
+            self.visit(body)
+        if node.orelse is not None:
+            self.emit(node.orelse[0])
+            self.visit(node.orelse[1])
+        self.emit(node.end)
+
+    def visit_NumericFor(self, node):
+        self.emit(node.token)
+        self.emit(node.var)
+        self.symbol("=", node.var)
+        self.visit(node.start)
+        self.symbol(",", node.var)
+        self.visit(node.stop)
+        if node.step is not None:
+            self.symbol(",", node.var)
+            self.visit(node.step)
+        self.emit(node.do)
+        self.visit(node.body)
+        self.emit(node.end)
+
+    def visit_GenericFor(self, node):
+        self.emit(node.token)
+        self.emit_names(node.names)
+        self.emit(tokenizer.token("in", tokenizer.KEYWORD, node.token))
+        self.emit_list(node.values, node.token)
+        self.emit(node.do)
+        self.visit(node.body)
+        self.emit(node.end)
+
+    def visit_Return(self, node):
+        self.emit(node.token)
+        self.emit_list(node.values, node.token)
+
+    def visit_Break(self, node):
+        self.emit(node.token)
+
+    def visit_Goto(self, node):
+        self.emit(node.token)
+        self.label(node.label)
+
+    def visit_Label(self, node):
+        self.emit(node.token)
+        self.label(node.name)
+        self.symbol("::", node.name)
+
+    # Expressions
+
+    def visit_Name(self, node):
+        self.emit(node.token)
+
+    def visit_Value(self, node):
+        self.emit(node.token)
+
+    def visit_Function(self, node):
+        self.emit_function(node, False)
+
+    def emit_function(self, node, method):
+        """
+        :param method: Takes self first, function a:b()
+        """
+
+        self.emit(tokenizer.token("function", tokenizer.KEYWORD, node.token))
+        self.symbol("(", node.token)
+        if method:
+            self.emit(tokenizer.token("self", tokenizer.NAME, node.token))
+            if node.params:
+                self.symbol(",", node.token)
+        self.emit_names(node.params)
+        self.symbol(")", node.token)
+        self.visit(node.body)
+        self.emit(node.end)
+
+    def visit_Table(self, node):
+        self.emit(node.token)
+        self.emit_list(node.fields, node.token)
+        if node.trailing:
+            self.symbol(",", node.end)
+        self.emit(node.end)
+
+    def visit_TableField(self, node):
+        name = node.name
+        if name is not None:
+            if name.kind == tokenizer.NAME:
+                # a = 1 -> ["a"] = 1
+                self.symbol("[", name)
+                self.string("__TABLE_KEY_" + name.text + "__", name.text, name)
+                self.symbol("]", name)
+            else:
+                self.emit(name)
+            self.symbol("=", name)
+        elif node.key is not None:
+            self.emit(node.token)
+            self.visit(node.key)
+            self.symbol("]", node.token)
+            self.symbol("=", node.token)
+        self.visit(node.value)
+
+    def visit_Field(self, node):
+        """
+        A chain of suffixes (a.b, a[b], a(b), a:b(c)) is walked down to what they are on
+        and emitted back up, without recursing on every suffix: a.b.c:d():e() can be long
+        """
+
+        chain = []
+        while isinstance(node, SUFFIXES):
+            chain.append(node)
+            node = node.func if isinstance(node, syntax.Call) else node.value
+
+        # Calls through the helper open before their receiver, the outermost first
+        for suffix in chain:
+            if isinstance(suffix, syntax.Method) and not isinstance(suffix.value, syntax.Name):
+                self.emit(tokenizer.token(METHOD_CALL, tokenizer.NAME, suffix.token))
+                self.symbol("(", suffix.token)
+
+        self.visit(node)
+
+        for suffix in reversed(chain):
+            if isinstance(suffix, syntax.Field):
+                self.emit_field(suffix)
+            elif isinstance(suffix, syntax.Index):
+                self.emit_index(suffix)
+            elif isinstance(suffix, syntax.Call):
+                self.emit_call(suffix)
+            else:
+                self.emit_method(suffix)
+
+    visit_Index = visit_Call = visit_Method = visit_Field
+
+    def emit_field(self, node):
+        # Named after what it is a field of, for reading the debug output
+        table = self.out[-1].text if self.out else ""
+        name = node.name
+        self.symbol("[", node.token)
+        self.string("__TABLE_" + table + "_FIELD_" + name.text + "__", name.text, name)
+        self.symbol("]", name)
+
+    def emit_index(self, node):
+        self.emit(node.token)
+        self.visit(node.key)
+        self.emit(node.end)
+
+    def emit_call(self, node):
+        near = self.out[-1]
+        self.symbol("(", near)
+        self.emit_list(node.args, near)
+        self.symbol(")", near)
+
+    def emit_method(self, node):
+        """
+        a:b(c) -> a.b(a, c) when a is a name.
+        Anything else is only evaluated once, by passing it to the helper (see obfuscator.add_method_call):
+            f():b(c) -> __METHOD_CALL__(f(), [[b]], c)
+        The helper and its '(' are emitted before the receiver, by visit_Field.
+        """
+
+        value = node.value
+        name = node.name
+        if isinstance(value, syntax.Name):
+            self.symbol("[", node.token)
+            self.string("__TABLE_" + value.token.text + "_FIELD_" + name.text + "__", name.text, name)
+            self.symbol("]", name)
+            self.symbol("(", name)
+            self.emit(value.token.copy())
+        else:
+            self.symbol(",", node.token)
+            self.string("__METHOD_" + name.text + "__", name.text, name)
+
+        if node.args:
+            self.symbol(",", name)
+            self.emit_list(node.args, name)
+        self.symbol(")", name)
+
+    def visit_Paren(self, node):
+        self.emit(node.token)
+        self.visit(node.value)
+        self.emit(node.end)
+
+    def visit_UnaryOp(self, node):
+        self.emit(node.token)
+        self.visit(node.value)
+
+    def visit_BinaryOp(self, node):
+        # In order without recursing, a .. b .. c .. (...) can be long
+        todo = [node]
+        while todo:
+            item = todo.pop()
+            if isinstance(item, syntax.BinaryOp):
+                todo.append(item.right)
+                todo.append(item.token)
+                todo.append(item.left)
+            elif isinstance(item, tokenizer.Token):
+                self.emit(item)
+            else:
+                self.visit(item)
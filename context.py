@@ -0,0 +1,74 @@
+import random
+import stats
+
+
+class ObfuscationContext:
+    """
+    Everything that belongs to a single obfuscation run.
+    A new context is used for every run, so nothing carries over
+    from one file to the next and runs can happen side by side.
+    """
+
+    def __init__(self, debug=False, seed=None, quiet=False, jobs=1):
+        self.debug = debug
+
+        # Processes to rewrite one file with, see parallel.py
+        self.jobs = jobs
+
+        # Nothing is printed, for the library and the server
+        self.quiet = quiet
+
+        # Steps logged so far
+        self.current_step = 0
+
+        # Last string placeholder handed out
+        self.string_index = -1
+
+        # Every name given out by new_local_name, and the counter it works from
+        self.used_local_names = set()
+        self.local_name_index = 0
+
+        # The shuffled words and characters local names are made of
+        self.name_words = None
+        self.name_chars = None
+
+        # Binding key -> name, for the names given out this run
+        # and the names to give the same bindings again (see incremental.py)
+        self.names = {}
+        self.previous_names = {}
+
+        # String -> slot in the constant table, given out this run
+        # and kept from the last run (see stringstripper.intern_strings)
+        self.string_slots = {}
+        self.previous_string_slots = {}
+
+        # When set, every string is encoded with its own random numbers
+        # seeded by this and the string, so it always encodes the same way
+        self.string_seed = None
+
+        # How long each stage took
+        self.stats = stats.RunStats()
+
+        # The seed, None for a random run
+        self.seed = seed
+
+        # The module itself unless a seed is given,
+        # so random.seed() still works for the old callers
+        self.random = random if seed is None else random.Random(seed)
+
+    def log(self, s, debug_only=True):
+        if self.quiet:
+            return
+
+        if not debug_only:
+            print(s)
+        else:
+            if self.debug:
+                print(s)
+            else:
+                self.current_step += 1
+                print("Step {0}...Done.".format(self.current_step))
+
+    def new_string_placeholder(self):
+        self.string_index += 1
+        return "__STRING_{0}__".format(self.string_index)
@@ -0,0 +1,21 @@
+class ObfuscationError(Exception):
+    """
+    The input could not be obfuscated.
+    line is where the problem starts in the input, if it is known.
+    """
+
+    def __init__(self, message, line=None):
+        super().__init__(message)
+        self.line = line
+
+
+class StripError(ObfuscationError):
+    """
+    A string or comment that never ends
+    """
+
+
+class ParseError(ObfuscationError):
+    """
+    The code is not valid Lua, like a table that is never closed
+    """
@@ -1,46 +1,103 @@
+import contextlib
+import os
 import re
 import tokenizer
 
 WORD_PTRN = re.compile(r"^[^" + re.escape("".join(tokenizer.SPECIAL_CHARS)) + r"]*$")
 
+# Tokens that need a space between them when they are next to each other
+SPACED_KINDS = (tokenizer.NAME, tokenizer.INTERNAL, tokenizer.KEYWORD, tokenizer.NUMBER)
+
+
+# How many pieces of code are joined into each chunk when streaming
+CHUNK_SIZE = 1024
+
 
 def finalize(tokens, decrypt_code):
-    tokens = finalize_tokens(tokens)
-    lua = render_code(tokens, decrypt_code)
-    return lua
+    return "".join(iter_code(tokens, decrypt_code))
 
 
-def finalize_tokens(tokens):
+def write_code(tokens, decrypt_code, sink):
     """
-    Render out the tokens into an obfuscated file
+    Writes the code to a binary file-like sink in utf-8 chunks,
+    so the whole program is never in memory as one string
+    """
+
+    sink.writelines(chunk.encode("utf-8") for chunk in iter_code(tokens, decrypt_code))
+
+
+@contextlib.contextmanager
+def open_output(path):
+    """
+    A binary file to write to in place of path (the output, a cache entry, a saved state).
+    path is only replaced once the with block finishes, so a failed run never leaves half a file behind.
+    """
+
+    out_dir = os.path.dirname(path)
+    if out_dir:
+        os.makedirs(out_dir, exist_ok=True)
+
+    temp_path = "{0}.{1}.tmp".format(path, os.getpid())
+    try:
+        with open(temp_path, "wb") as f:
+            yield f
+        os.replace(temp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(temp_path)
+        raise
+
+
+def iter_code(tokens, decrypt_code, chunk_size=CHUNK_SIZE):
+    """
+    The obfuscated file in chunks of code
+    """
+
+    yield decrypt_code + " "
+    for pieces in iter_pieces(tokens, chunk_size):
+        yield "".join(pieces)
+
+
+def iter_pieces(tokens, chunk_size=CHUNK_SIZE):
+    """
+    The pieces of code (tokens and spaces) in lists of about chunk_size
     """
 
     out = []
     skip = (';',)
     last = None
+    last_word = False
     for t in tokens:
+        word = is_word(t)
+
         if last is None:
-            out.append(t)
+            out.append(t.text)
             last = t
+            last_word = word
             continue
 
         # Check if the last value was a word, and this value is a word
         # OR check if the last word was a return so it doesn't get called
-        if (is_word(last) and is_word(t)) or last in tokenizer.RESERVED_WORDS:
+        if (last_word and word) or last.kind == tokenizer.KEYWORD:
             out.append(" ")
 
-        if t in skip:
+        if t.text in skip:
             continue
 
         last = t
-        out.append(t)
-
-    return out
+        last_word = word
+        out.append(t.text)
 
+        if len(out) >= chunk_size:
+            yield out
+            out = []
 
-def render_code(tokens, decrypt_code):
-    return decrypt_code + " " + "".join(tokens)
+    if out:
+        yield out
 
 
-def is_word(s):
-    return WORD_PTRN.match(s)
\ No newline at end of file
+def is_word(t):
+    if t.kind == tokenizer.STRING:
+        # Replaced strings may or may not look like a word depending on the encoder
+        return WORD_PTRN.match(t.text) is not None
+    return t.kind in SPACED_KINDS
@@ -0,0 +1,170 @@
+"""
+Incremental obfuscation: the random choices of a file are saved after each run
+and made the same way on the next one, so code that did not change comes out the same.
+
+For each file the state keeps
+    the XOR,
+    the seed the local name order (and anything else random) comes from,
+    the name every local, argument and loop variable was given,
+    the slot every string has in the constant table.
+
+A variable keeps its name as long as the variables of the same kind and name
+before it stay the same, new variables get names nobody has used yet.
+With a seed every string is encoded on its own (see Encoder.encode_all),
+so a string looks the same in every run.
+"""
+
+import hashlib
+import json
+import os
+import random
+
+import context
+import finalize
+import obfuscator
+
+
+class FileState:
+    """
+    What a file was obfuscated with last time
+    """
+
+    __slots__ = ("xor", "seed", "names", "slots")
+
+    def __init__(self, xor, seed, names=None, slots=None):
+        self.xor = xor
+        self.seed = seed
+
+        # Binding key -> name, see obfuscator._rename_bindings
+        self.names = names if names is not None else {}
+
+        # String -> slot, see stringstripper.intern_strings
+        self.slots = slots if slots is not None else {}
+
+    def to_dict(self):
+        return {
+            "xor": self.xor,
+            "seed": self.seed,
+            "names": self.names,
+            "slots": self.slots,
+        }
+
+
+def new_state():
+    rng = random.SystemRandom()
+    return FileState(rng.randint(0, 255), rng.randint(0, 2 ** 32 - 1))
+
+
+def load_state(path):
+    """
+    :return: The FileState saved at path, or a new one if there is none (or it can not be read)
+    """
+
+    try:
+        with open(path, "r") as f:
+            data = json.load(f)
+        return FileState(int(data["xor"]), int(data["seed"]), dict(data["names"]), dict(data.get("slots", {})))
+    except (OSError, ValueError, KeyError, TypeError):
+        return new_state()
+
+
+def save_state(path, state):
+    # Through a temporary file, so a crash never leaves half a state behind
+    with finalize.open_output(path) as f:
+        f.write(json.dumps(state.to_dict(), indent=1, sort_keys=True).encode("utf-8"))
+
+
+def state_path(state_dir, name):
+    """
+    :param name: The input file, relative to the input directory in batch mode
+    """
+
+    return os.path.join(state_dir, name + ".json")
+
+
+def file_state_path(state_dir, path):
+    """
+    The state of a file obfuscated on its own, named after the file and a hash of its absolute path,
+    so files with the same name in different directories (init.lua, shared.lua) keep their own state
+    """
+
+    path = os.path.abspath(path)
+    digest = hashlib.sha256(path.encode("utf-8")).hexdigest()[:16]
+    return state_path(state_dir, "{0}.{1}".format(os.path.basename(path), digest))
+
+
+def new_context(state, debug=False):
+    """
+    An ObfuscationContext that makes the same choices as the run the state came from
+    """
+
+    ctx = context.ObfuscationContext(debug, state.seed)
+    ctx.previous_names = state.names
+    ctx.previous_string_slots = state.slots
+    ctx.string_seed = state.seed
+
+    # New names must not take one that is already given out
+    ctx.used_local_names.update(state.names.values())
+    return ctx
+
+
+def obfuscate(lua, encoder, globs, state, debug=False, ctx=None, cache=None, sink=None):
+    """
+    Obfuscates lua with the choices in state, then updates state with the names given out.
+    The state is not changed when the output comes from the cache.
+    :param ctx: From new_context(state), a new one by default
+    :param sink: A binary file to stream the code to instead, None is returned
+    :return: Obfuscated Lua
+    """
+
+    if ctx is None:
+        ctx = new_context(state, debug)
+
+    if cache is None:
+        code = obfuscator.obfuscate(lua, encoder, globs, debug, state.xor, ctx, sink)[0]
+        state.names = ctx.names
+        state.slots = ctx.string_slots
+        return code
+
+    ctx.stats.begin("cache")
+    key = cache_key(cache, lua, encoder.level, globs, state)
+    if sink is not None:
+        code = None
+        hit = cache.copy_to(key, sink)
+    else:
+        code = cache.get(key)
+        hit = code is not None
+    ctx.stats.end()
+
+    if hit:
+        ctx.log("Loaded from cache.", False)
+        return code
+
+    if sink is None:
+        code = obfuscator.obfuscate(lua, encoder, globs, debug, state.xor, ctx)[0]
+    else:
+        # Into the sink while it is written, the entry may be evicted before it could be read back
+        with cache.writer(key, sink) as f:
+            obfuscator.obfuscate(lua, encoder, globs, debug, state.xor, ctx, f)
+    state.names = ctx.names
+    state.slots = ctx.string_slots
+
+    # Filed under the names this run ended with, running again
+    # from this state gives the same names and the same output
+    new_key = cache_key(cache, lua, encoder.level, globs, state)
+
+    if sink is None:
+        cache.put(new_key, code)
+        return code
+
+    cache.move(key, new_key)
+    return None
+
+
+def cache_key(cache, lua, level, globs, state):
+    """
+    The output cache key of lua obfuscated from this state
+    """
+
+    return cache.key(lua, level, globs, state.xor,
+                     (state.seed, sorted(state.names.items()), sorted(state.slots.items())))
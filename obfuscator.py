@@ -1,460 +1,345 @@
-import time
 import stringstripper
 import tokenizer
+import syntax
+import codegen
 import finalize
-import random
+import scope
+import context
+import parallel
+import pipeline
 
 
-INVISIBLE_CHAR = "\u202A"
-DECRYPT_FUNC = INVISIBLE_CHAR * 7
-_G = INVISIBLE_CHAR
-
-
-current_step = 0
-debug_mode = False
+INVISIBLE_CHAR = tokenizer.INVISIBLE_CHAR
 
+# Characters that make up local names, none of them are visible
+NAME_CHARS = [INVISIBLE_CHAR, "\u200B", "\u200C", "\u200D", "\u2060", "\u2061", "\u2062", "\u2063", "\u2064"]
+DECRYPT_FUNC = INVISIBLE_CHAR * 7
 
-def log(s, debug_only=True):
-    global current_step
-
-    if not debug_only:
-        print(s)
-    else:
-        if debug_mode:
-            print(s)
-        else:
-            current_step += 1
-            print("Step {0}...Done.".format(current_step))
+# The table of every (decrypted) string, see stringstripper.intern_strings.
+# Short since it is everywhere, local names always have a word in them so it is free
+STRINGS_TABLE = "\u200B"
+_G = INVISIBLE_CHAR
 
 
-def obfuscate(lua, encoder, globs, debug=False, xor_val=-1):
+def obfuscate(lua, encoder, globs, debug=False, xor_val=-1, ctx=None, sink=None):
     """
-    Does the complete obfuscation process, returning the result
-    :return: Obfuscated Lua, Tokens, Strings, Comments
+    Does the complete obfuscation process, returning the result.
+    All state for the run is kept in ctx (a new ObfuscationContext by default),
+    so obfuscate can be called any number of times, from any number of threads.
+    The globs passed in (any collection of names, like the frozenset from api.load_globals) are not changed.
+    How long every stage took is in ctx.stats afterwards.
+    :param sink: A binary file-like object to write the code to in chunks (utf-8),
+                 instead of returning it as one string
+    :return: Obfuscated Lua (None with a sink), Tokens, Encoded constants, Comments
     """
 
-    # Set the debug_mode global to the debug mode argument passed
-    global debug_mode
-    debug_mode = debug
-
-    start_time = time.time()
+    if ctx is None:
+        ctx = context.ObfuscationContext(debug)
+    log = ctx.log
+    stats = ctx.stats
 
     # Get an XOR to use
     if xor_val == -1:
-        xor_val = random.randint(0, 255)
+        xor_val = ctx.random.randint(0, 255)
         log("Randomly chose XOR value {0}.".format(xor_val), False)
 
     # Set the XOR in the decryption code
+    stats.begin("decrypt_code")
     decrypt_code = encoder.get_decrypt_code(xor_val)
+    stats.end()
 
     # Strip comments and strings
-    lua, strings, comments = stringstripper.strip(lua)
+    stats.begin("strip")
+    lua, strings, comments = stringstripper.strip(lua, ctx)
+    stats.end()
     log("Stripped {0} strings and {1} comments.".format(len(strings), len(comments)), False)
 
     # Tokenize
-    tokens = tokenizer.tokenize(lua)
+    stats.begin("tokenize")
+    tokens = tokenizer.tokenize(lua, strings)
+    stats.end(tokens)
     log("Finished tokenizing {0} tokens.".format(len(tokens)), False)
 
     # About to begin
     log("Beginning Level {0} obfuscation...".format(encoder.level), False)
 
-    # Make sure all functions are called with ()
-    # Ex: print"Hello!" -> print("Hello!")
-    tokens = tokenizer.fix_functions(tokens, strings)
-    log("Fixed function notation.")
-
-    # Obfuscate
-    tokens = rearrange_functions(tokens)
-    log("Rearranged functions.")
-
-    tokens = colon_to_dot(tokens)
-    tokens, strings = dot_to_index(tokens, strings)
-    log("Rewrote table references.")
-
-    tokens, strings = fix_tables(tokens, strings)
-    log("Rewrote table keys.")
-
-    tokens = rename_locals(tokens)
-    log("Obfuscated locals.")
-
-    tokens = rename_arguments(tokens)
-    log("Renamed function arguments.")
-
-    tokens = rename_loops(tokens)
-    log("Renamed loop variables.")
+    # A set of its own, so the globals passed in are left alone and lookups are O(1)
+    globs = set(globs)
+    known = len(globs)
 
-    # Copy the old globals
-    old_globs = globs[:]
-    globs = assume_globals(tokens, globs)
-    # Don't print here because the function prints on its own
-
-    assumed = len(globs) - len(old_globs)
-
-    tokens, strings = rename_globals(tokens, strings, globs)
-    log("Obfuscated globals (with {0} assumed).".format(assumed))
-
-    strings = encoder.encode_all(strings, xor_val)
+    if ctx.jobs > 1:
+        # On parts of the file at once
+        rewrite = pipeline.barrier("rewrite_parallel", lambda t: parallel.rewrite(t, strings, ctx.jobs)[0],
+                                   "Rewrote functions and tables on {0} processes.".format(ctx.jobs))
+    else:
+        # Parse, then rewrite function declarations, method calls, table fields and keys in one walk
+        # Ex: print"Hello!" -> print("Hello!"), a:b() -> a.b(a)
+        rewrite = pipeline.barrier("rewrite", lambda t: rewrite_statements(t, strings)[0],
+                                   "Rewrote functions and tables.")
+
+    # String -> slot in the table of constants, filled by intern_strings
+    used = {}
+
+    tokens = pipeline.run([
+        rewrite,
+
+        # Only once for the whole file, the parts of a parallel rewrite may each call it
+        pipeline.barrier("add_method_call", add_method_call),
+
+        # Every scope has to be known
+        pipeline.barrier("rename_variables", lambda t: rename_variables(t, ctx),
+                         "Renamed locals, arguments and loop variables."),
+
+        # One sweep from here on
+        pipeline.stream("assume_globals", lambda t: assume_globals(t, globs, ctx)),
+        pipeline.stream("rename_globals", lambda t: rename_globals(t, strings, globs)),
+
+        # Every string is only in the file once, the same string used again is a table index
+        pipeline.stream("intern", lambda t: stringstripper.intern_strings(t, strings, STRINGS_TABLE,
+                                                                         ctx.previous_string_slots, used)),
+    ], tokens, ctx)
+    log("Obfuscated globals (with {0} assumed).".format(len(globs) - known))
+
+    stats.begin("constant_table")
+    table, constants = stringstripper.constant_table(used, STRINGS_TABLE, tokens[0] if tokens else None)
+    ctx.string_slots = used
+    stats.end(table)
+    log("Interned {0} strings as {1} constants.".format(len(strings), len(constants)))
+
+    stats.begin("encode")
+    constants = encoder.encode_all(constants, xor_val, ctx.random, ctx.string_seed)
+    stats.end()
     log("Obfuscated strings.")
 
-    tokens = stringstripper.replace(tokens, strings, DECRYPT_FUNC, encoder.get_str_start(), encoder.get_str_end())
+    # The placeholders left are all in the table
+    stats.begin("replace", table)
+    table = stringstripper.replace(table, constants, DECRYPT_FUNC, encoder.get_str_start(), encoder.get_str_end())
+    stats.end(table)
+    tokens = table + tokens
     log("Replaced strings.")
 
-    lua = finalize.finalize(tokens, decrypt_code)
-
-    log("Finished in {0:.3f} seconds.".format(time.time() - start_time), False)
-
-    return lua, tokens, strings, comments
-
+    stats.begin("finalize", tokens)
+    if sink is not None:
+        finalize.write_code(tokens, decrypt_code, sink)
+        lua = None
+    else:
+        lua = finalize.finalize(tokens, decrypt_code)
+    stats.end()
 
-def rearrange_functions(tokens, start_index=0):
-    """
-    First checks for meta functions
-    "function _PlayerMeta:Derp(...)" -> "function _PlayerMeta.Derp(self, ...)"
+    log("Finished in {0:.3f} seconds.".format(stats.seconds), False)
 
-    Then, moves function declarations around
-    "function f()"       -> "f = function()"
-    "local function f()" -> "local f = function()"
-    """
-    for i in range(start_index, len(tokens)):
-        t = tokens[i]
-        # Look for function declaration without '(' after
-        # EX:  function f()
-        if t == "function":
-            if tokens[i+1] != "(":
-                # Find the function declaration opening '('
-                p = index(tokens, "(", i)
-
-                # Fix meta function if it is a meta function
-                c = index(tokens, ":", i)
-                if i < c < p:
-                    # Colon was found, make it a . and fix function args
-                    tokens[c] = "."
-                    tokens.insert(p + 1, "self")
-                    if tokens[p+2] != ")":
-                        # If the function has arguments, add a comma here
-                        # otherwise, we are done
-                        # "(self a, b, c)" -> "(self, a, b, c)"
-                        tokens.insert(p + 2, ",")
-
-                # Insert the new function declaration
-                tokens.insert(p, "function")
-                tokens.insert(p, "=")
-
-                # Delete the old declaration
-                del tokens[i]
-                return rearrange_functions(tokens, i)
-    return tokens
+    return lua, tokens, constants, comments
 
 
-def dot_to_index(tokens, strings):
+def rewrite_statements(tokens, strings):
     """
-    Replaces "a.b" with "a[[[b]]]"
-    TODO a[[[b]]] -> a[_decrypt[[_encrypted_b]]]
+    Everything that only looks inside a statement, like obfuscate does.
+    What parallel.py runs on each part of a file.
+    :return: Tokens, strings
     """
 
-    if "." in tokens:
-        pos = index(tokens, ".")
-        table = tokens[pos - 1]
-        field = tokens[pos + 1]
-        codename = "__TABLE_" + table + "_FIELD_" + field + "__"
-        strings[codename] = field
-        tokens[pos] = "["
-        tokens[pos + 1] = codename
-        tokens.insert(pos + 2, "]")
-        dot_to_index(tokens, strings)
-
-    return tokens, strings
+    return codegen.generate(syntax.parse(tokens), strings)
 
 
-def colon_to_dot(tokens):
+def add_method_call(tokens):
     """
-    Replaces a:b() with a.b(a,?)
-    """
-
-    # TODO recognize shortcuts. ex: func{"table"}, func"string"
-
-    if ":" in tokens:
-        pos = index(tokens, ":")
-
-        # LocalPlayer() : SteamID()
-        # Start Index
-        #    ex: [ LocalPlayer, (, ), :, SteamID, (, ) ]
-        #             0 ^
+    Declares the helper method calls pass their receiver to (see codegen.Generator.visit_Method)
+    at the top of the file, if anything calls it
 
-        start = find_beginning(tokens, pos - 1)
-        end = pos
-        size = end - start
+        local __METHOD_CALL__ = function(t, k, ...) return t[k](t, ...) end
 
-        # ex: [ LocalPlayer, (, ) ]
-        tbl = tokens[start:end]
-
-        # ex: [ LocalPlayer, (, ), :, SteamID, (, LocalPlayer, (, ), ) ]
-        tokens = tokens[:end + 3] + tbl + tokens[end + 3:]
+    It is a local like any other, so it gets renamed with the rest.
+    """
 
-        tokens[pos] = "."
+    if not any(t.text == codegen.METHOD_CALL and t.kind == tokenizer.NAME for t in tokens):
+        return tokens
 
-        if tokens[pos + 3 + size] != ")":
-            # Add a comma if there are other args:  table.field(table, args...)
-            tokens.insert(pos + size + 3, ",")
+    near = tokens[0]
 
-        return colon_to_dot(tokens)
+    def word(text):
+        return tokenizer.token(text, tokenizer.NAME, near)
 
-    return tokens
+    def keyword(text):
+        return tokenizer.token(text, tokenizer.KEYWORD, near)
 
+    def symbol(text):
+        return tokenizer.token(text, near=near)
 
-def rename_locals(tokens):
-    for i in range(len(tokens)):
-        t = tokens[i]
-        if t == "local":
-            # Look for local declaration
-            l = tokens[i+1]
-
-            # Should never happen since rearrange_functions() is called first
-            if l == "function":
-                continue
-
-            # i + 1   name
-            # i + 2   =
-            # i + 3   (_G.)named
-            start_index = i
-            if tokens[i + 2] == "=":
-                start_index = i + 4
-
-            new_name = new_local_name(i+1)
-            tokens = replace_locals(tokens, l, new_name, start_index)
-            tokens[i + 1] = new_name
-
-            # local a, b ...
-            if tokens[i+2] == ",":
-                j = i + 3
-                while True:
-                    l = tokens[j]
-                    if tokens[j-1] == "," and is_var(l):
-                        new_name = new_local_name(j)
-                        tokens[j] = new_name
-                        tokens = replace_locals(tokens, l, new_name, j+2)
-                        j += 2
-                    else:
-                        break
+    # Every use is a token of its own, renaming changes tokens in place
+    helper = [keyword("local"), word(codegen.METHOD_CALL), symbol("="), keyword("function"),
+              symbol("("), word("t"), symbol(","), word("k"), symbol(","), symbol("..."), symbol(")"),
+              keyword("return"), word("t"), symbol("["), word("k"), symbol("]"),
+              symbol("("), word("t"), symbol(","), symbol("..."), symbol(")"),
+              keyword("end")]
+    return helper + tokens
 
-    return tokens
 
+def rename_variables(tokens, ctx):
+    """
+    Finds out what every local, argument and loop variable refers to,
+    then renames the locals, the arguments and the loop variables (in that order)
+    """
 
-def rename_globals(tokens, strings, globs, start_index=0):
-    for i in range(start_index, len(tokens)):
-        t = tokens[i]
-        if t in globs and is_not_table_member(tokens, i):
-            codename = "__GLOBAL_" + t + "__"
-            strings[codename] = t
-            tokens[i] = "]"
-            tokens.insert(i, codename)
-            tokens.insert(i, "[")
-            tokens.insert(i, _G)
-            return rename_globals(tokens, strings, globs, i)
-    return tokens, strings
-
-
-def rename_arguments(tokens):
-    replaced = []
-    for i in range(len(tokens)):
-        t = tokens[i]
-        if t == "function":
-            # Look for functions that have arguments
-            if tokens[i+1] == "(" and tokens[i+2] != ")":
-                e = index(tokens, ")", i+2)
-
-                # Find everything between parenthesis,
-                # skip the comma between every 2 args
-                args = tokens[i+2:e:2]
-
-                for arg in args:
-                    if arg not in replaced:
-                        new_name = new_local_name(index(tokens, arg))
-                        tokens = replace_locals(tokens, arg, new_name, i)
-                        replaced.append(arg)
+    bindings = scope.resolve(tokens)
+    rename_locals(tokens, bindings, ctx)
+    rename_arguments(tokens, bindings, ctx)
+    rename_loops(tokens, bindings, ctx)
     return tokens
 
 
-def rename_loops(tokens):
-    replaced = []
-    for i in range(len(tokens)):
-        t = tokens[i]
-        if t == "for":
-            # Look for 'for' loops
-
-            if tokens[i+2] == "=":
-                # for a=b,c,d
-                # Only one variable @ i+1
-                v = tokens[i+1]
-                if v not in replaced:
-                    tokens = replace_locals(tokens, v, new_local_name(i+1), i)
-                    replaced.append(v)
-
-            else:
-                # for a,b,c,d... in ...
-                # any amount of variables between 'for' and 'in'
-                e = index(tokens, "in", i)
-                args = tokens[i+1:e:2]
-                for arg in args:
-                    if arg not in replaced:
-                        tokens = replace_locals(tokens, arg, new_local_name(index(tokens, arg)), i)
-                        replaced.append(arg)
+def rename_locals(tokens, bindings, ctx):
+    """
+    Renames every local variable along with all of its uses
+    :param bindings: From scope.resolve()
+    """
 
-    return tokens
+    return _rename_bindings(tokens, bindings, scope.LOCAL, ctx)
 
 
-def fix_tables(tokens, strings):
+def rename_globals(tokens, strings, globs):
     """
-    Changes table declarations so that
-
-        {                       {
-            a = 1      ->           ["a"] = 1
-        }                       }
+    Replaces every global "a" with "_G[[[a]]]"
 
+    Streams the tokens through, O(n) as long as globs is a set.
     """
 
-    # Table depth. Only replace keys if the depth is > 0.
-    depth = 0
+    last = None
+    for t in tokens:
+        if t.text in globs and tokenizer.is_variable(t) and (last is None or last.text != "."):
+            codename = "__GLOBAL_" + t.text + "__"
+            strings[codename] = t.text
+            yield tokenizer.token(_G, tokenizer.INTERNAL, t)
+            yield tokenizer.token("[", near=t)
+            last = tokenizer.token("]", near=t)
+            yield tokenizer.token(codename, tokenizer.STRING, t)
+            yield last
+        else:
+            last = t
+            yield t
 
-    for i in range(len(tokens)):
-        t = tokens[i]
 
-        if t == "{":
-            depth += 1
-        elif t == "}":
-            depth -= 1
+def rename_arguments(tokens, bindings, ctx):
+    return _rename_bindings(tokens, bindings, scope.ARGUMENT, ctx)
 
-        # print(depth, t)
 
-        # Look for a table opening or next entry
-        if t == "{" or t == "," and depth > 0:
-            # Look for a variable name followed by '='
-            if is_var(tokens[i+1]) and tokens[i+2] == "=":
-                # Replace the variable name with a '[', '__STRING__', ']'
-                n = tokens[i+1]
-                s = "__TABLE_KEY_" + n + "__"
-                strings[s] = n
-                tokens[i+1] = "]"
-                tokens.insert(i+1, s)
-                tokens.insert(i+1, "[")
-                return fix_tables(tokens, strings)
+def rename_loops(tokens, bindings, ctx):
+    return _rename_bindings(tokens, bindings, scope.LOOP, ctx)
 
-    return tokens, strings
 
+def _rename_bindings(tokens, bindings, kind, ctx):
+    """
+    Gives each binding of the kind a new name,
+    every token was already resolved so this is O(bindings + uses)
+    """
 
-def replace_locals(tokens, old_name, new_name, start_index):
-    for i in range(start_index, len(tokens)):
-        if tokens[i] == old_name and is_not_table_member(tokens, i):
-            tokens[i] = new_name
+    # A binding is known by its kind, name and how many bindings
+    # of that kind and name came before it, the name it got last time is used again
+    counts = {}
+    for b in bindings:
+        if b.kind == kind:
+            count = counts.get(b.name, 0)
+            counts[b.name] = count + 1
+            key = "{0}:{1}:{2}".format(kind, b.name, count)
+
+            new_name = ctx.previous_names.get(key)
+            if new_name is None:
+                new_name = new_local_name(ctx)
+            ctx.names[key] = new_name
+
+            for t in b.tokens:
+                rename(t, new_name)
     return tokens
 
 
-def assume_globals(tokens, globs):
+def assume_globals(tokens, globs, ctx):
     """
     Assumes all non-builtin valid variable names
     are global and changes them
-    EX: DarkRP will be placed in globs list
-    """
-
-    for i in range(len(tokens)):
-        t = tokens[i]
-        if t not in globs and is_var(t):
-            log('Assuming "{0}" is a global.'.format(t), False)
-            globs.append(t)
-
-    return globs
+    EX: DarkRP will be placed in globs set
 
-
-def find_beginning(tokens, i):
-    """
-    Finds the beginning of the expression at the index
-
-    EX:
-        Tokens:
-            LocalPlayer ( )
-            ^             ^
-            |             |
-            |             input index
-            output index
+    Streams the tokens through with set lookups, the assumed globals are logged together at the end.
+    A name is in globs before its token goes on to rename_globals.
     """
 
-    if is_var(tokens[i]):
-        return i
+    assumed = []
+    for t in tokens:
+        if is_var(t) and t.text not in globs:
+            globs.add(t.text)
+            assumed.append(t.text)
+        yield t
 
-    last = tokens[i]
-    depth = 0
-
-    while True:
-        i -= 1
-        t = tokens[i]
-        nxt = None
+    if assumed:
+        ctx.log("Assuming {0} globals: {1}".format(len(assumed), ", ".join(assumed)), False)
 
-        if i > 0:
-            nxt = tokens[i - 1]
 
-        if last == ")" or last == "}":
-            depth += 1
-        elif last == "(" or last == "{":
-            depth -= 1
+def new_local_name(ctx):
+    """
+    Hands out the next unused local name.
 
-        if depth == 0:
-            if t in ["="]:
-                return i + 1
-            if is_var(t) and nxt != "." and not is_var(last):
-                return i
-            # This will not work for table stuff right now
-            # _G.LocalPlayer() will not look for the '_G.'
+    The name counter is written as a builtin word (the lowest digit) and
+    a bijective base len(NAME_CHARS) number made of invisible characters,
+    placed on a random side of the word. With the 23 words and 9 characters (as shuffled):
 
-        last = t
+        0 -> words[0] + chars[0], 1 -> chars[0] + words[1], ..., 22 -> chars[0] + words[22],
+        23 -> chars[1] + words[0], ..., 206 -> chars[8] + words[22],
+        207 -> chars[0] + chars[0] + words[0], the first name with two characters
 
+    Every counter value gives a different name, so there is nothing to retry,
+    and names only grow logarithmically with the number of locals.
+    The word and character order is shuffled once per run.
+    """
 
-USED_LOCAL_NAMES = []
+    if ctx.name_words is None:
+        ctx.name_words = tokenizer.BUILTIN_WORDS[:]
+        ctx.name_chars = NAME_CHARS[:]
+        ctx.random.shuffle(ctx.name_words)
+        ctx.random.shuffle(ctx.name_chars)
 
+    words = ctx.name_words
+    chars = ctx.name_chars
+    used = ctx.used_local_names
 
-def new_local_name(i):
-    # if variable_obfuscation_type == ...
-    #     return INVISIBLE_CHAR * (i + 10)
-    # else
+    while True:
+        n = ctx.local_name_index
+        ctx.local_name_index += 1
 
-    i = len(USED_LOCAL_NAMES) + 2
+        word = words[n % len(words)]
+        invisible = _bijective(n // len(words) + 1, chars)
 
-    left = random.randint(0, 1)
-    right = 1 - left
+        if ctx.random.randint(0, 1):
+            name = invisible + word
+        else:
+            name = word + invisible
 
-    name = left * INVISIBLE_CHAR * random.randint(1, i) + \
-        random.choice(tokenizer.BUILTIN_WORDS) + \
-        right * INVISIBLE_CHAR * random.randint(1, i)
+        # Only taken if it was reserved up front
+        if name not in used:
+            used.add(name)
+            return name
 
-    # If the name already exists pick a new one
-    if name in USED_LOCAL_NAMES:
-        return new_local_name(i)
 
-    USED_LOCAL_NAMES.append(name)
+def _bijective(n, digits):
+    """
+    Writes n > 0 in bijective base len(digits), which has no zero digit,
+    so every n has exactly one non-empty representation
+    """
 
-    return name
+    base = len(digits)
+    out = []
+    while n > 0:
+        n, r = divmod(n - 1, base)
+        out.append(digits[r])
+    return "".join(out)
 
 
-# This might need to be moved to tokenizer
 def is_var(t):
-    return INVISIBLE_CHAR not in t and tokenizer.is_word(t) and not t[:2] == "__" and not t[-2:] == "__"
-
-
-def is_not_table_member(tokens, index):
-    """
-    Tries to guess if the token at the index is local
-    """
+    return t.kind == tokenizer.NAME
 
-    pre = tokens[index - 1]
 
-    return pre != "."
 
-
-def index(tokens, item, start_index=0):
+def rename(t, new_name):
     """
-    Returns the index of a token in a list, or -1
+    Renames a variable token, it will not be picked up as a variable again
     """
-    try:
-        i = tokens.index(item, start_index)
-        return i
-    except:
-        return -1
\ No newline at end of file
+
+    t.text = new_name
+    t.kind = tokenizer.INTERNAL
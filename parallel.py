@@ -0,0 +1,116 @@
+"""
+Rewrites the statements of one big file on several processes.
+
+Parsing and rewriting (see obfuscator.rewrite_statements) only look inside the statement
+they are on, so the tokens can be cut before any top level statement,
+parsed and rewritten part by part and joined again.
+The placeholders the rewrite makes are named after their text, so the strings
+of every part fit together.
+
+Everything that needs the whole file (scopes, renaming, globals) still runs
+once on the joined tokens, which keeps the names the same across parts.
+The output is the same as without parallel.
+"""
+
+import concurrent.futures
+
+import obfuscator
+import tokenizer
+
+
+# Parts smaller than this are not worth sending to another process
+MIN_PART_TOKENS = 20000
+
+# Parts per process, so one slow part does not hold up the rest
+PARTS_PER_JOB = 4
+
+# Keywords that can only start a statement
+STATEMENT_STARTS = ("local", "if", "for", "while", "repeat")
+
+BLOCK_OPEN = tokenizer.SCOPE_IN + ["repeat"]
+BLOCK_CLOSE = tokenizer.SCOPE_OUT + ["until"]
+
+
+def rewrite(tokens, strings, jobs):
+    """
+    obfuscator.rewrite_statements on jobs processes
+    :return: Tokens, strings
+    """
+
+    parts = split(tokens, jobs * PARTS_PER_JOB)
+    if len(parts) < 2:
+        return obfuscator.rewrite_statements(tokens, strings)
+
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(obfuscator.rewrite_statements, part, _strings_in(part, strings)) for part in parts]
+
+        out = []
+        for future in futures:
+            part, part_strings = future.result()
+            out.extend(part)
+            strings.update(part_strings)
+
+    return out, strings
+
+
+def split(tokens, parts):
+    """
+    Cuts the tokens into about parts lists of about the same size,
+    only before top level statements, and none smaller than MIN_PART_TOKENS
+    """
+
+    parts = min(parts, len(tokens) // MIN_PART_TOKENS)
+    if parts < 2:
+        return [tokens]
+
+    size = len(tokens) / parts
+    cuts = []
+    for i in statement_starts(tokens):
+        if i >= size * (len(cuts) + 1) and i - (cuts[-1] if cuts else 0) >= MIN_PART_TOKENS:
+            cuts.append(i)
+            if len(cuts) == parts - 1:
+                break
+
+    if len(tokens) - (cuts[-1] if cuts else 0) < MIN_PART_TOKENS and cuts:
+        # Too little left for a part of its own
+        cuts.pop()
+
+    bounds = [0] + cuts + [len(tokens)]
+    return [tokens[bounds[n]:bounds[n + 1]] for n in range(len(bounds) - 1)]
+
+
+def statement_starts(tokens):
+    """
+    Yields the index of every token that starts a statement outside of any block or brackets
+    """
+
+    depth = 0
+    brackets = 0
+    for i, t in enumerate(tokens):
+        text = t.text
+
+        if t.kind == tokenizer.KEYWORD:
+            if depth == 0 and brackets == 0 and i > 0 and (
+                    text in STATEMENT_STARTS or
+                    # A function statement, not a function value, and not the rest of a local function
+                    (text == "function" and i + 1 < len(tokens) and tokens[i + 1].kind == tokenizer.NAME and
+                     tokens[i - 1].text != "local")):
+                yield i
+
+            if text in BLOCK_OPEN:
+                depth += 1
+            elif text in BLOCK_CLOSE:
+                depth -= 1
+
+        elif text in ("(", "[", "{"):
+            brackets += 1
+        elif text in (")", "]", "}"):
+            brackets -= 1
+
+
+def _strings_in(tokens, strings):
+    """
+    Only the strings the part uses, so the rest are not sent to every process
+    """
+
+    return {t.text: strings[t.text] for t in tokens if t.kind == tokenizer.STRING and t.text in strings}
@@ -0,0 +1,92 @@
+"""
+Runs passes over the tokens, streaming them through as many passes at once as it can.
+
+A streaming pass is a generator function: it takes an iterator of tokens and yields the tokens that
+come out, only keeping what it needs as it goes (the last token, a set of names, a counter).
+Streaming passes next to each other are chained, so every token goes through all of them
+before the next one is read, in one sweep with no list in between.
+
+A barrier needs all of the tokens at once, or everything before it to be finished
+(a syntax tree, the scope of every name). It takes a list and returns a list,
+the tokens coming out of the streaming passes before it are put in one first.
+
+    tokens = pipeline.run([
+        pipeline.barrier("rename", rename),
+        pipeline.stream("assume_globals", assume),
+        pipeline.stream("rename_globals", rename_globals),
+    ], tokens, ctx)
+
+The passes running together are timed as one stage, "assume_globals+rename_globals" above.
+"""
+
+
+class Pass:
+    """
+    :param message: Logged once the pass is done, if there is one
+    """
+
+    __slots__ = ("name", "func", "streams", "message")
+
+    def __init__(self, name, func, streams, message=None):
+        self.name = name
+        self.func = func
+        self.streams = streams
+        self.message = message
+
+
+def stream(name, func, message=None):
+    return Pass(name, func, True, message)
+
+
+def barrier(name, func, message=None):
+    return Pass(name, func, False, message)
+
+
+def groups(passes):
+    """
+    Splits the passes into the ones that run together: each barrier on its own,
+    and every run of streaming passes
+    """
+
+    group = []
+    for p in passes:
+        if not p.streams:
+            if group:
+                yield group
+                group = []
+            yield [p]
+        else:
+            group.append(p)
+    if group:
+        yield group
+
+
+def chain(passes, tokens):
+    """
+    The streaming passes chained over tokens, nothing runs until the result is iterated
+    """
+
+    for p in passes:
+        tokens = p.func(tokens)
+    return tokens
+
+
+def run(passes, tokens, ctx):
+    """
+    Runs the passes in order, timing every group in ctx.stats
+    :return: Tokens (a list)
+    """
+
+    for group in groups(passes):
+        ctx.stats.begin("+".join(p.name for p in group), tokens)
+        if group[0].streams:
+            tokens = list(chain(group, tokens))
+        else:
+            tokens = group[0].func(tokens)
+        ctx.stats.end(tokens)
+
+        for p in group:
+            if p.message is not None:
+                ctx.log(p.message)
+
+    return tokens
@@ -0,0 +1,243 @@
+import tokenizer
+
+# Binding kinds
+LOCAL = "local"
+ARGUMENT = "argument"
+LOOP = "loop"
+
+# Keywords that can not appear in the middle of an expression
+STATEMENT_WORDS = ['break', 'do', 'else', 'elseif', 'end', 'for', 'goto', 'if',
+                   'local', 'repeat', 'return', 'then', 'until', 'while', 'continue']
+
+# Keywords that are values
+VALUE_WORDS = ['true', 'false', 'nil']
+
+
+class Binding:
+    """
+    A declared variable and every token that refers to it
+    """
+
+    __slots__ = ("kind", "name", "tokens")
+
+    def __init__(self, kind, name):
+        self.kind = kind
+        self.name = name
+        self.tokens = []
+
+    def __repr__(self):
+        return "Binding({0}, {1!r}, {2} uses)".format(self.kind, self.name, len(self.tokens))
+
+
+class Scope:
+    """
+    A block of code opened by 'function', 'do', 'then', 'else' or 'repeat'
+    """
+
+    __slots__ = ("names", "pending", "loop_vars", "closing", "depth", "after_operand")
+
+    def __init__(self):
+        self.names = {}
+
+        # Declared by a 'local' statement, visible once its expressions end
+        self.pending = []
+
+        # Declared by a 'for', visible in the block opened by the next 'do'
+        self.loop_vars = None
+
+        # A 'repeat' block is closed once the 'until' expression ends
+        self.closing = False
+
+        # Bracket depth and whether the last token finished an operand,
+        # used to find where an expression ends
+        self.depth = 0
+        self.after_operand = False
+
+    def declare(self, kind, t, bindings):
+        b = Binding(kind, t.text)
+        b.tokens.append(t)
+        self.names[t.text] = b
+        bindings.append(b)
+
+
+def resolve(tokens):
+    """
+    Builds the scope tree in a single pass and resolves every
+    variable name to the local, argument or loop variable it refers to.
+    Names that do not resolve are globals and are left alone.
+
+    Handles shadowing, so a local only covers its own block:
+
+        do local a end    ->   do local x end
+        print(a)               print(a)
+
+    :return: Every Binding in the order it was declared
+    """
+
+    bindings = []
+    scopes = [Scope()]
+    last = None
+
+    n = len(tokens)
+    i = 0
+    while i < n:
+        t = tokens[i]
+        i += 1
+        text = t.text
+        top = scopes[-1]
+
+        # Finish any expression that this token can not be a part of
+        while (top.pending or top.closing) and top.depth == 0 and _ends_expression(t, top.after_operand):
+            for kind, name in top.pending:
+                top.declare(kind, name, bindings)
+            top.pending = []
+
+            if top.closing and len(scopes) > 1:
+                scopes.pop()
+                top = scopes[-1]
+            else:
+                top.closing = False
+
+        if tokenizer.is_variable(t):
+            if last is None or last.text not in (".", ":"):
+                b = _lookup(scopes, text)
+                if b is not None:
+                    b.tokens.append(t)
+            top.after_operand = True
+
+        elif t.kind == tokenizer.KEYWORD:
+            top.after_operand = False
+
+            if text == "local":
+                # local a, b, c (= ...)
+                names = []
+                while i < n and tokenizer.is_variable(tokens[i]):
+                    names.append(tokens[i])
+                    if i + 1 < n and tokens[i + 1].text == ",":
+                        i += 2
+                    else:
+                        i += 1
+                        break
+
+                if i < n and tokens[i].text == "=":
+                    top.pending.extend((LOCAL, name) for name in names)
+                else:
+                    for name in names:
+                        top.declare(LOCAL, name, bindings)
+
+            elif text == "function":
+                # function (a, b, ...)
+                p = i
+                while p < n and tokens[p].text != "(":
+                    p += 1
+                if p < n:
+                    # function a.b() has not been rearranged, 'a' is a use of a variable
+                    if i < p and tokenizer.is_variable(tokens[i]):
+                        b = _lookup(scopes, tokens[i].text)
+                        if b is not None:
+                            b.tokens.append(tokens[i])
+
+                    end = p
+                    while end < n and tokens[end].text != ")":
+                        end += 1
+
+                    scope = Scope()
+                    for arg in tokens[p + 1:end]:
+                        if tokenizer.is_variable(arg):
+                            scope.declare(ARGUMENT, arg, bindings)
+                    scopes.append(scope)
+                    i = end + 1
+
+            elif text == "for":
+                # for a, b in ... do / for a = ... do
+                loop_vars = []
+                while i < n and tokens[i].text not in ("=", "in"):
+                    if tokenizer.is_variable(tokens[i]):
+                        loop_vars.append(tokens[i])
+                    i += 1
+                top.loop_vars = loop_vars
+
+            elif text == "do":
+                scope = Scope()
+                if top.loop_vars is not None:
+                    for v in top.loop_vars:
+                        scope.declare(LOOP, v, bindings)
+                    top.loop_vars = None
+                scopes.append(scope)
+
+            elif text == "then" or text == "repeat":
+                scopes.append(Scope())
+
+            elif text == "else":
+                _close(scopes)
+                scopes.append(Scope())
+
+            elif text == "elseif" or text == "end":
+                _close(scopes)
+                scopes[-1].after_operand = text == "end"
+
+            elif text == "until":
+                top.closing = True
+
+            elif text == "goto":
+                # Labels are not variables
+                i += 1
+
+            elif text in VALUE_WORDS:
+                top.after_operand = True
+
+        elif text in ("(", "[", "{"):
+            top.depth += 1
+            top.after_operand = False
+
+        elif text in (")", "]", "}"):
+            top.depth -= 1
+            top.after_operand = True
+
+        elif text == "::":
+            # ::label::
+            i += 2
+            top.after_operand = False
+
+        else:
+            top.after_operand = t.kind != tokenizer.SYMBOL or text == "..."
+
+        last = tokens[i - 1]
+
+    # Anything left over at the end of the file
+    for scope in scopes:
+        for kind, name in scope.pending:
+            scope.declare(kind, name, bindings)
+
+    return bindings
+
+
+def _ends_expression(t, after_operand):
+    """
+    Checks if the token starts a new statement instead of continuing the expression
+    """
+
+    if t.text == ";" or t.text == "::":
+        return True
+    if t.kind == tokenizer.KEYWORD:
+        if t.text in STATEMENT_WORDS:
+            return True
+        if t.text in ('and', 'or'):
+            return False
+        return after_operand
+    if t.kind in (tokenizer.NAME, tokenizer.INTERNAL, tokenizer.NUMBER):
+        return after_operand
+    return False
+
+
+def _lookup(scopes, name):
+    for i in range(len(scopes) - 1, -1, -1):
+        b = scopes[i].names.get(name)
+        if b is not None:
+            return b
+    return None
+
+
+def _close(scopes):
+    if len(scopes) > 1:
+        scopes.pop()
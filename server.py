@@ -0,0 +1,107 @@
+"""
+A long running obfuscator for build systems: one JSON request per line in, one JSON response per line out,
+so the interpreter, compiled regexes, globals and templates are only loaded once.
+
+    python __main__.py --server
+
+Request:
+    {"id": 1, "source": "print('hi')", "level": 2}
+    "input": a path to read instead of "source",
+    "output": a path to write the code to instead of returning it,
+    "xor", "seed": like the command line (random by default),
+    "state": a path to keep the incremental state of the file in (see incremental.py)
+
+Response:
+    {"id": 1, "ok": true, "code": "...", "cached": false, "seconds": 0.01}
+    {"id": 1, "ok": false, "error": "StripError", "message": "Unterminated string starting on line 1.", "line": 1}
+
+Responses are written in the same order as the requests. The id is sent back as it is.
+"""
+
+import json
+import time
+
+import api
+import errors
+import finalize
+import incremental
+import stringstripper
+
+
+def serve(infile, outfile, cache=None, globs=None):
+    """
+    Answers requests from infile until it ends
+    :param cache: An OutputCache for every request, or None
+    :param globs: Known global names, the ones in globals.json by default
+    """
+
+    if globs is None:
+        globs = api.load_globals()
+
+    for line in infile:
+        line = line.strip()
+        if not line:
+            continue
+
+        response = handle(line, cache, globs)
+        outfile.write(json.dumps(response) + "\n")
+        outfile.flush()
+
+
+def handle(line, cache, globs):
+    """
+    :return: The response to a single request line
+    """
+
+    start_time = time.perf_counter()
+    request_id = None
+    try:
+        try:
+            request = json.loads(line)
+        except ValueError as e:
+            raise _BadRequest("Not JSON: {0}".format(e))
+        if not isinstance(request, dict):
+            raise _BadRequest("A request must be a JSON object")
+        request_id = request.get("id")
+
+        source = request.get("source")
+        if source is None:
+            if "input" not in request:
+                raise _BadRequest("A request needs a \"source\" or an \"input\"")
+            source = stringstripper.read_source(request["input"])
+
+        state = None
+        if request.get("state") is not None:
+            state = incremental.load_state(request["state"])
+
+        options = api.Options(int(request.get("level", 1)), int(request.get("xor", -1)), request.get("seed"),
+                              globs, cache, state)
+        result = api.obfuscate_source(source, options)
+
+        response = {"id": request_id, "ok": True, "cached": result.cached}
+        if request.get("output") is not None:
+            with finalize.open_output(request["output"]) as f:
+                f.write(result.code.encode("utf-8"))
+        else:
+            response["code"] = result.code
+
+        if state is not None:
+            incremental.save_state(request["state"], state)
+
+    except errors.ObfuscationError as e:
+        response = _error(request_id, type(e).__name__, str(e), e.line)
+    except _BadRequest as e:
+        response = _error(request_id, "BadRequest", str(e))
+    except (OSError, ValueError, TypeError) as e:
+        response = _error(request_id, type(e).__name__, str(e))
+
+    response["seconds"] = time.perf_counter() - start_time
+    return response
+
+
+class _BadRequest(Exception):
+    pass
+
+
+def _error(request_id, error, message, line=None):
+    return {"id": request_id, "ok": False, "error": error, "message": message, "line": line}
@@ -0,0 +1,86 @@
+import json
+import time
+
+
+class StageStats:
+    """
+    How long one stage took and how many tokens it went from and to.
+    The token counts are None for stages that do not work on tokens.
+    """
+
+    __slots__ = ("name", "seconds", "tokens_before", "tokens_after")
+
+    def __init__(self, name, tokens_before=None):
+        self.name = name
+        self.seconds = 0.0
+        self.tokens_before = tokens_before
+        self.tokens_after = None
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "seconds": self.seconds,
+            "tokens_before": self.tokens_before,
+            "tokens_after": self.tokens_after,
+        }
+
+
+class RunStats:
+    """
+    The timings of every stage of one obfuscation run, in the order they ran
+
+        stats.begin("rearrange", tokens)
+        tokens = rearrange_functions(tokens)
+        stats.end(tokens)
+    """
+
+    def __init__(self):
+        self.stages = []
+        self.seconds = 0.0
+
+        self._current = None
+        self._started = 0.0
+
+    def begin(self, name, tokens=None):
+        self._current = StageStats(name, None if tokens is None else len(tokens))
+        self._started = time.perf_counter()
+
+    def end(self, tokens=None):
+        stage = self._current
+        stage.seconds = time.perf_counter() - self._started
+        stage.tokens_after = None if tokens is None else len(tokens)
+
+        self.stages.append(stage)
+        self.seconds += stage.seconds
+        self._current = None
+        return stage
+
+    def get(self, name):
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def to_dict(self):
+        return {
+            "seconds": self.seconds,
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+    def format(self):
+        """
+        A table of the stages, slowest stages are easy to spot by the percentages
+        """
+
+        lines = ["{0:<18} {1:>9} {2:>6} {3:>10} {4:>10}".format("Stage", "Seconds", "%", "Tokens in", "Tokens out")]
+        for stage in self.stages:
+            share = 100 * stage.seconds / self.seconds if self.seconds else 0
+            lines.append("{0:<18} {1:>9.4f} {2:>5.1f}% {3:>10} {4:>10}".format(
+                stage.name, stage.seconds, share,
+                "-" if stage.tokens_before is None else stage.tokens_before,
+                "-" if stage.tokens_after is None else stage.tokens_after))
+        lines.append("{0:<18} {1:>9.4f}".format("Total", self.seconds))
+        return "\n".join(lines)
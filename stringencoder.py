@@ -1,36 +1,86 @@
 import obfuscator
+import os
 import random
 import math
 from string import ascii_letters, digits
 
 
+# Stands in for the random characters of Level3Encoder until they are picked
+_RANDOM_MARK = "\x00"
+
+
+class _MarkRandom:
+    """
+    Picks the mark every time, in place of a random module
+    """
+
+    @staticmethod
+    def choice(seq):
+        return _RANDOM_MARK
+
+
+class _CharTable(dict):
+    """
+    A str.translate table that fills itself in with encode(char) the first time a character is seen,
+    so the whole string is encoded by one translate call
+    """
+
+    def __init__(self, encode):
+        dict.__init__(self)
+        self.encode = encode
+
+    def __missing__(self, code):
+        out = self[code] = self.encode(chr(code))
+        return out
+
+
 class Encoder:
     def __init__(self):
         self.level = 0
 
-    def encode_all(self, strings, xor):
+        # xor -> _CharTable
+        self._tables = {}
+
+    def encode_all(self, strings, xor, rng=random, seed=None):
+        """
+        Encodes every string.
+        With a seed, each string gets its own random numbers seeded by the seed and the string,
+        so a string encodes the same way no matter what else is in the file.
+        """
+
         for k in strings.keys():
-            strings[k] = self.encode(strings[k], xor)
+            if seed is not None:
+                rng = random.Random("{0}:{1}".format(seed, strings[k]))
+            strings[k] = self.encode(strings[k], xor, rng)
         return strings
 
-    def encode(self, string, xor):
+    def encode(self, string, xor, rng=random):
         """
         Encode the string in such a way that
         each character is xor'd and backslashes
-        are escaped properly
+        are escaped properly.
+        The whole string goes through a single str.translate,
+        the output is the same as encode_char on every character.
         """
 
         if len(string) == 0:
             return string
 
-        out = []
-        for c in string:
-            out.append(self.encode_char(c, xor))
-        return ''.join(out)
+        return string.translate(self.get_table(xor))
 
-    def encode_char(self, c, xor):
+    def encode_char(self, c, xor, rng=random):
         return c
 
+    def get_table(self, xor):
+        """
+        The translate table for the xor, every character is only encoded once
+        """
+
+        table = self._tables.get(xor)
+        if table is None:
+            table = self._tables[xor] = _CharTable(lambda c: self.encode_char(c, xor))
+        return table
+
     def get_decrypt_code(self, xor):
         """
         No need to decrypt plaintext
@@ -53,9 +103,10 @@ class Level1Encoder(Encoder):
     """
 
     def __init__(self):
+        super().__init__()
         self.level = 1
 
-    def encode_char(self, c, xor):
+    def encode_char(self, c, xor, rng=random):
         c = chr(ord(c) ^ xor)
 
         if c not in ascii_letters:
@@ -79,9 +130,10 @@ class Level2Encoder(Encoder):
     """
 
     def __init__(self):
+        super().__init__()
         self.level = 2
 
-    def encode_char(self, c, xor):
+    def encode_char(self, c, xor, rng=random):
         x = ord(c) ^ xor
         return "{:02x}".format(x)
 
@@ -102,9 +154,32 @@ class Level3Encoder(Encoder):
         and then each character is closed with '|'.
     """
     def __init__(self):
+        super().__init__()
         self.level = 3
 
-    def encode_char(self, c, xor):
+    def encode(self, string, xor, rng=random):
+        """
+        Translates the string with a table that leaves a mark for every
+        random character, then fills in the marks in order.
+        Picks the random characters in the same order as encode_char.
+        """
+
+        if len(string) == 0:
+            return string
+
+        parts = string.translate(self.get_table(xor)).split(_RANDOM_MARK)
+        if len(parts) == 1:
+            return parts[0]
+
+        choice = rng.choice
+        chars = ascii_letters + digits
+
+        out = [None] * (len(parts) * 2 - 1)
+        out[0::2] = parts
+        out[1::2] = [choice(chars) for _ in range(len(parts) - 1)]
+        return ''.join(out)
+
+    def encode_char(self, c, xor, rng=random):
         total = ord(c) ^ xor
 
         # number of regular characters
@@ -113,23 +188,76 @@ class Level3Encoder(Encoder):
         # number of invis characters (lua counts 1 invis as 3)
         invis = math.floor(total / 3)
 
-        regchars = ''.join(random.choice(ascii_letters + digits) for _ in range(regular))
+        regchars = ''.join(rng.choice(ascii_letters + digits) for _ in range(regular))
 
         return obfuscator.INVISIBLE_CHAR * invis + regchars + "|"
 
+    def get_table(self, xor):
+        """
+        encode_char with a mark in place of each random character
+        """
+
+        table = self._tables.get(xor)
+        if table is None:
+            table = self._tables[xor] = _CharTable(lambda c: self.encode_char(c, xor, _MarkRandom))
+        return table
+
 
-def get_by_level(level):
+# The digits of Level4Encoder, in the same order as the table in __decrypt_4.lua
+INVISIBLE_DIGITS = ["\u200B", "\u200C", "\u200D", "\u200E", "\u200F", "\u202A", "\u202C", "\u2060",
+                    "\u2061", "\u2062", "\u2063", "\u2064", "\u2066", "\u2067", "\u2068", "\u2069"]
+
+
+class Level4Encoder(Encoder):
+    """
+        Encode the string in such a way that
+        each character is xor'd and then written
+        as two base 16 digits, each digit being one
+        of 16 invisible characters (3 bytes long).
+        Invisible like Level 3, but always
+        6 bytes per character.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.level = 4
+
+    def encode_char(self, c, xor, rng=random):
+        code = ord(c)
+        if code > 255:
+            # Lua strings are bytes
+            return ''.join(self.encode_char(chr(b), xor) for b in c.encode("utf-8"))
+
+        x = code ^ xor
+        return INVISIBLE_DIGITS[x >> 4] + INVISIBLE_DIGITS[x & 15]
+
+
+# The decrypt templates are next to this file
+TEMPLATE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def get_by_level(level, warn=True):
     if level == 1:
         return Level1Encoder()
     elif level == 2:
         return Level2Encoder()
     elif level == 3:
         return Level3Encoder()
+    elif level == 4:
+        return Level4Encoder()
     else:
-        print("Warning!!! Not using an encoder!")
+        if warn:
+            print("Warning!!! Not using an encoder!")
         return Encoder()
 
 
+# Level -> its template split at every __XOR__, each one is only read once
+_templates = {}
+
+
 def _read_decrypt_file(level, xor):
-    with open("__decrypt_" + str(level) + ".lua", "rb") as f:
-        return f.read().decode("utf-8").replace("__XOR__", str(xor))
\ No newline at end of file
+    parts = _templates.get(level)
+    if parts is None:
+        with open(os.path.join(TEMPLATE_DIR, "__decrypt_" + str(level) + ".lua"), "rb") as f:
+            parts = _templates[level] = f.read().decode("utf-8").split("__XOR__")
+    return str(xor).join(parts)
\ No newline at end of file
@@ -1,153 +1,256 @@
-
+import mmap
+import os
 import re
+import context
+import errors
+import tokenizer
 
-STRING_START_MULTILINE = ["[["]
-STRING_END_MULTILINE = ["]]"]
-STRING_START = ['"', "'"]
-STRING_END = ['"', "'"]
+STRING_QUOTES = ['"', "'"]
 COMMENT = ["//", "--"]
-COMMENT_START = ["/*", "--[["]
-COMMENT_END = ["*/", "]]"]
-
-ALL_SYMBOLS = STRING_START_MULTILINE + STRING_END_MULTILINE + \
-    STRING_START + STRING_END + COMMENT + COMMENT_START + COMMENT_END
-
-
-def strip(lua):
-    # Start with Multi-Line Comments
-    lua, removed_multiline_comments = strip_multiline_comments(lua)
+COMMENT_START = ["/*"]
+COMMENT_END = ["*/"]
+
+# Span kinds produced by lex()
+CODE = "code"
+COMMENT_SPAN = "comment"
+STRING_SPAN = "string"
+
+# Anything that may begin a string or a comment
+_SPAN_START = re.compile(r"[\"'\[/-]")
+
+# [[, [=[, [==[ ... (the level is the number of '=')
+_LONG_BRACKET = re.compile(r"\[(=*)\[")
+
+_QUOTED = {q: re.compile(q + r"((?:[^" + q + r"\\\n]|\\[\s\S])*)" + q) for q in STRING_QUOTES}
+
+
+def read_source(path):
+    """
+    The file at path as a str, decoded straight from a memory map of it,
+    so the raw bytes are never read into memory next to the text
+    """
+
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # An empty file can not be mapped
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as source:
+            return str(source, "utf-8")
+
+
+def strip(lua, ctx=None):
+    """
+    Removes every string and comment from the source in a single scan.
+    Strings are swapped out for placeholders, comments for whitespace.
+    Newlines inside of removed spans are kept so line numbers still line up.
+    :param ctx: ObfuscationContext handing out the placeholders, a new one by default
+    :return: Stripped Lua, {placeholder: string}, [comment]
+    """
+
+    if ctx is None:
+        ctx = context.ObfuscationContext()
+
+    out = []
+    strings = {}
+    comments = []
+
+    for kind, text, value in lex(lua):
+        if kind == CODE:
+            out.append(text)
+            continue
+
+        newlines = "\n" * text.count("\n")
+        if kind == COMMENT_SPAN:
+            comments.append(text)
+            out.append(" " + newlines)
+        else:
+            placeholder = ctx.new_string_placeholder()
+            strings[placeholder] = value.encode("utf-8").decode("unicode_escape")
+            out.append(" " + placeholder + " " + newlines)
 
-    # Strip strings
-    lua, strings = strip_strings(lua)
+    return "".join(out), strings, comments
 
-    # Strip comments
-    lua, removed_comments = strip_comments(lua)
 
-    # Check for failure
-    for s in ALL_SYMBOLS:
-        if s in lua:
-            print("Error!!! Failed to correctly strip strings.")
-            print("Here is a dump of the strings stripped:")
-            for v in strings.values():
-                print("\t", v)
-            exit()
+def lex(lua):
+    """
+    Splits the source into code, comment and string spans
+    in one left to right scan, so the cost is linear in the input size.
 
-    return lua, strings, removed_multiline_comments + removed_comments
+    Yields (kind, text, value) where text is the raw source of the span
+    and value is the contents of a string literal (None for other spans).
 
+    Handles:
+        -- line comments, // line comments
+        --[[ ]] and --[==[ ]==] block comments, /* */ block comments
+        "quoted" and 'quoted' strings with backslash escapes
+        [[ ]] and [==[ ]==] long strings
+    """
 
-def replace(lua, strings, decrypt_func="", start="[[", end="]]"):
-    start = decrypt_func + start
-    if isinstance(lua, str):
-        for k, v in strings.items():
-            lua = lua.replace(k, start + v + end)
-    else:
-        for k, v in strings.items():
-            for i in range(len(lua)):
-                if lua[i] == k:
-                    lua[i] = start + v + end
-    return lua
+    i = 0
+    code_start = 0
+    n = len(lua)
 
-
-def strip_multiline_comments(lua):
-    removed = []
-    for i in range(len(COMMENT_START)):
-        r = _build_regex(COMMENT_START[i], COMMENT_END[i])
-        while True:
-            match = r.search(lua)
-            if match is None:
-                break
-            removed.append(match.group(0))
-            lua = lua[:match.start()] + lua[match.end():]
-            print(match)
-
-    return lua, removed
-
-
-def strip_comments(lua):
-    removed = []
-    for i in range(len(COMMENT)):
-        r = _build_regex(COMMENT[i])
-        while True:
-            match = r.search(lua)
-            if match is None:
-                break
-            removed.append(match.group())
-            lua = lua[:match.start()] + lua[match.end():]
-    return lua, removed
-
-
-def strip_strings(lua):
-    lua, removed = _strip_multiline_strings(lua)
-    lua, _removed = _strip_regular_strings(lua)
-    removed.update(_removed)
-
-    for k in removed.keys():
-        removed[k] = removed[k].encode("utf-8").decode("unicode_escape")
-
-    return lua, removed
-
-
-def _strip_regular_strings(lua):
-    removed = {}
-    patterns = []
-
-    for i in range(len(STRING_START)):
-        start, end = STRING_START[i], STRING_END[i]
-        patterns.append(_build_regex(start, end, False))
-
-    while True:
-        found = None
-        first = len(lua) + 1
-
-        # Find the first match
-        for r in patterns:
-            match = r.search(lua)
-            if match is not None:
-                if found is None or match.start() < first:
-                    found = match
-                    first = match.start()
-
-        if found is not None:
-            placeholder = _build_string_placeholder()
-            removed[placeholder] = found.group()[len(start):-len(end)]
-            lua = lua[:found.start()] + " " + placeholder + " " + lua[found.end():]
-        else:
+    while i < n:
+        match = _SPAN_START.search(lua, i)
+        if match is None:
             break
 
-    return lua, removed
+        start = match.start()
+        c = lua[start]
+        kind = None
+
+        if c == "-" or c == "/":
+            pair = lua[start:start + 2]
+            if pair in COMMENT:
+                kind = COMMENT_SPAN
+                long = _LONG_BRACKET.match(lua, start + 2) if pair == "--" else None
+                if long is not None:
+                    end = _find_long_end(lua, long, start)
+                else:
+                    end = lua.find("\n", start)
+                    if end == -1:
+                        end = n
+            elif pair in COMMENT_START:
+                kind = COMMENT_SPAN
+                close = COMMENT_END[COMMENT_START.index(pair)]
+                end = lua.find(close, start + 2)
+                if end == -1:
+                    _fail(lua, start, "Unterminated comment")
+                end += len(close)
+        elif c == "[":
+            long = _LONG_BRACKET.match(lua, start)
+            if long is not None:
+                kind = STRING_SPAN
+                end = _find_long_end(lua, long, start)
+                value = lua[long.end():end - len(long.group())]
+        else:
+            quoted = _QUOTED[c].match(lua, start)
+            if quoted is None:
+                _fail(lua, start, "Unterminated string")
+            kind = STRING_SPAN
+            end = quoted.end()
+            value = quoted.group(1)
+
+        if kind is None:
+            # Just an operator, keep scanning
+            i = start + 1
+            continue
+
+        if code_start < start:
+            yield CODE, lua[code_start:start], None
+
+        yield kind, lua[start:end], value if kind == STRING_SPAN else None
+
+        i = code_start = end
+
+    if code_start < n:
+        yield CODE, lua[code_start:], None
+
+
+def intern_strings(tokens, strings, table_name, slots, used):
+    """
+    Gives every distinct string one slot in a table of constants,
+    and makes every string token an index into it
+
+        print("a", "b", "a")  ->  local T = {"a", "b"} print(T[1], T[2], T[1])
+
+    so each string is in the file (and decrypted) once, when the file is loaded.
+    Slots that are no longer used are left as nil.
+
+    Streams: yields the tokens, filling used (string -> slot) on the way.
+    constant_table makes the table once they are all through.
+    :param slots: String -> slot from an earlier run (see incremental.py), those strings keep their slot
+    """
+
+    previous = slots if slots is not None else {}
+    next_slot = max(previous.values(), default=0) + 1
+
+    for t in tokens:
+        if t.kind != tokenizer.STRING or t.text not in strings:
+            yield t
+            continue
+
+        value = strings[t.text]
+        slot = used.get(value)
+        if slot is None:
+            slot = previous.get(value)
+            if slot is None:
+                slot = next_slot
+                next_slot += 1
+            used[value] = slot
+
+        yield tokenizer.token(table_name, tokenizer.INTERNAL, t)
+        yield tokenizer.token("[", near=t)
+        yield tokenizer.token(str(slot), tokenizer.NUMBER, t)
+        yield tokenizer.token("]", near=t)
+
+
+def constant_table(used, table_name, near):
+    """
+    The declaration of the table of constants for intern_strings
+    :param used: String -> slot
+    :return: Tokens, constants (placeholder -> string)
+    """
+
+    if not used:
+        return [], {}
+
+    by_slot = {slot: value for value, slot in used.items()}
+    constants = {}
+    table = [tokenizer.token("local", tokenizer.KEYWORD, near),
+             tokenizer.token(table_name, tokenizer.INTERNAL, near),
+             tokenizer.token("=", near=near),
+             tokenizer.token("{", near=near)]
+    for slot in range(1, max(by_slot) + 1):
+        if slot > 1:
+            table.append(tokenizer.token(",", near=near))
+
+        if slot in by_slot:
+            placeholder = "__CONSTANT_{0}__".format(slot)
+            constants[placeholder] = by_slot[slot]
+            table.append(tokenizer.token(placeholder, tokenizer.STRING, near))
+        else:
+            table.append(tokenizer.token("nil", tokenizer.KEYWORD, near))
+    table.append(tokenizer.token("}", near=near))
 
+    return table, constants
 
-def _strip_multiline_strings(lua):
-    removed = {}
-    for i in range(len(STRING_START_MULTILINE)):
-        start, end = STRING_START_MULTILINE[i], STRING_END_MULTILINE[i]
-        r = _build_regex(start, end)
-        while True:
-            match = r.search(lua)
-            if match is None:
-                break
-            placeholder = _build_string_placeholder()
-            removed[placeholder] = match.group()[len(start):-len(end)]
-            lua = lua[:match.start()] + placeholder + lua[match.end():]
-    return lua, removed
 
+def replace(lua, strings, decrypt_func="", start="[[", end="]]"):
+    """
+    Replaces every placeholder with decrypt_func + start + string + end.
+    lua is either a list of tokens, done with a lookup per token,
+    or a str, done with a single regex matching any placeholder (longest first).
+    Both are one pass, whatever the number of strings.
+    """
 
-string_index = -1
-def _build_string_placeholder():
-    global string_index
-    string_index += 1
-    return "__STRING_{0}__".format(string_index)
+    start = decrypt_func + start
+    if isinstance(lua, str):
+        if not strings:
+            return lua
+        pattern = re.compile("|".join(re.escape(k) for k in sorted(strings, key=len, reverse=True)))
+        return pattern.sub(lambda m: start + strings[m.group(0)] + end, lua)
+
+    get = strings.get
+    for t in lua:
+        v = get(t.text)
+        if v is not None:
+            t.text = start + v + end
+    return lua
 
 
-def _build_regex(start, end=None, multiline=True):
+def _find_long_end(lua, opening, start):
+    """
+    Returns the index after the long bracket closing the opening match
+    """
 
-    if end is None:
-        # Return a simple single line regex
-        return re.compile(re.escape(start) + r".*?$", re.MULTILINE)
+    close = "]" + opening.group(1) + "]"
+    end = lua.find(close, opening.end())
+    if end == -1:
+        _fail(lua, start, "Unterminated long string or comment")
+    return end + len(close)
 
-    if multiline:
-        rs = re.escape(start) + r"(.|\n|\r)*?" + re.escape(end)
-    else:
-        rs = start + r'(?:[^' + end + r'\\]|\\.)*' + end
 
-    return re.compile(rs)
+def _fail(lua, position, reason):
+    line = lua.count("\n", 0, position) + 1
+    raise errors.StripError("{0} starting on line {1}.".format(reason, line), line)
@@ -0,0 +1,783 @@
+"""
+A syntax tree for Lua 5.1 (and what GLua adds to it), parsed from the tokens.
+
+    tree = syntax.parse(tokens)
+
+Every node keeps the tokens it was parsed from where there is one (names, keywords, operators),
+so the tokens can be renamed after the tree is turned back into tokens (see codegen.py).
+Separators like ',' are not kept.
+
+The parser and the tree walks do not recurse on long chains of operators or suffixes
+(a .. b .. c, a.b:c().d), only on nesting (brackets, functions and blocks).
+Nesting deeper than the recursion limit allows, around 120 functions inside each other,
+is a ParseError.
+"""
+
+import errors
+import tokenizer
+
+
+# Left and right priority of every binary operator, like lparser.c.
+# Right associative operators bind less to the right.
+BINARY_PRIORITY = {
+    "or": (1, 1), "||": (1, 1),
+    "and": (2, 2), "&&": (2, 2),
+    "<": (3, 3), ">": (3, 3), "<=": (3, 3), ">=": (3, 3), "==": (3, 3), "~=": (3, 3), "!=": (3, 3),
+    "|": (4, 4), "~": (5, 5), "&": (6, 6), "<<": (7, 7), ">>": (7, 7),
+    "..": (9, 8),
+    "+": (10, 10), "-": (10, 10),
+    "*": (11, 11), "/": (11, 11), "%": (11, 11),
+    "^": (14, 13),
+}
+
+UNARY_OPERATORS = ("not", "-", "#", "!", "~")
+UNARY_PRIORITY = 12
+
+# Keywords that end a block
+BLOCK_ENDS = ("end", "else", "elseif", "until")
+
+# Kind of the token after the last one
+END_OF_FILE = "end of file"
+
+
+class Node:
+    __slots__ = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # The Visitor method for the class
+        cls.visit_name = "visit_" + cls.__name__
+
+    def __repr__(self):
+        return "{0}({1})".format(type(self).__name__,
+                                 ", ".join("{0}={1!r}".format(name, getattr(self, name)) for name in self.__slots__))
+
+
+# Statements
+
+class Block(Node):
+    __slots__ = ("body",)
+
+    def __init__(self, body):
+        self.body = body
+
+
+class Local(Node):
+    """
+    local a, b = 1, 2 (values is empty without the '=')
+    """
+
+    __slots__ = ("token", "names", "values")
+
+    def __init__(self, token, names, values):
+        self.token = token
+        self.names = names
+        self.values = values
+
+
+class LocalFunction(Node):
+    __slots__ = ("token", "name", "func")
+
+    def __init__(self, token, name, func):
+        self.token = token
+        self.name = name
+        self.func = func
+
+
+class FunctionStatement(Node):
+    """
+    function a.b.c() / function a.b:c(), with method set for the ':'
+    target is the Name or Field the function is stored in
+    """
+
+    __slots__ = ("target", "method", "func")
+
+    def __init__(self, target, method, func):
+        self.target = target
+        self.method = method
+        self.func = func
+
+
+class Assign(Node):
+    __slots__ = ("targets", "token", "values")
+
+    def __init__(self, targets, token, values):
+        self.targets = targets
+        self.token = token
+        self.values = values
+
+
+class CallStatement(Node):
+    __slots__ = ("call",)
+
+    def __init__(self, call):
+        self.call = call
+
+
+class Do(Node):
+    __slots__ = ("token", "body", "end")
+
+    def __init__(self, token, body, end):
+        self.token = token
+        self.body = body
+        self.end = end
+
+
+class While(Node):
+    __slots__ = ("token", "condition", "do", "body", "end")
+
+    def __init__(self, token, condition, do, body, end):
+        self.token = token
+        self.condition = condition
+        self.do = do
+        self.body = body
+        self.end = end
+
+
+class Repeat(Node):
+    __slots__ = ("token", "body", "until", "condition")
+
+    def __init__(self, token, body, until, condition):
+        self.token = token
+        self.body = body
+        self.until = until
+        self.condition = condition
+
+
+class If(Node):
+    """
+    clauses are (if/elseif token, condition, then token, Block),
+    orelse is (else token, Block) or None
+    """
+
+    __slots__ = ("clauses", "orelse", "end")
+
+    def __init__(self, clauses, orelse, end):
+        self.clauses = clauses
+        self.orelse = orelse
+        self.end = end
+
+
+class NumericFor(Node):
+    """
+    for i = start, stop, step do (step is None when there is none)
+    """
+
+    __slots__ = ("token", "var", "start", "stop", "step", "do", "body", "end")
+
+    def __init__(self, token, var, start, stop, step, do, body, end):
+        self.token = token
+        self.var = var
+        self.start = start
+        self.stop = stop
+        self.step = step
+        self.do = do
+        self.body = body
+        self.end = end
+
+
+class GenericFor(Node):
+    __slots__ = ("token", "names", "values", "do", "body", "end")
+
+    def __init__(self, token, names, values, do, body, end):
+        self.token = token
+        self.names = names
+        self.values = values
+        self.do = do
+        self.body = body
+        self.end = end
+
+
+class Return(Node):
+    __slots__ = ("token", "values")
+
+    def __init__(self, token, values):
+        self.token = token
+        self.values = values
+
+
+class Break(Node):
+    """
+    break, or continue in GLua
+    """
+
+    __slots__ = ("token",)
+
+    def __init__(self, token):
+        self.token = token
+
+
+class Goto(Node):
+    __slots__ = ("token", "label")
+
+    def __init__(self, token, label):
+        self.token = token
+        self.label = label
+
+
+class Label(Node):
+    __slots__ = ("token", "name")
+
+    def __init__(self, token, name):
+        self.token = token
+        self.name = name
+
+
+# Expressions
+
+class Name(Node):
+    __slots__ = ("token",)
+
+    def __init__(self, token):
+        self.token = token
+
+
+class Value(Node):
+    """
+    nil, true, false, a number, a string or ...
+    """
+
+    __slots__ = ("token",)
+
+    def __init__(self, token):
+        self.token = token
+
+
+class Function(Node):
+    """
+    The parameters are tokens, '...' included
+    """
+
+    __slots__ = ("token", "params", "body", "end")
+
+    def __init__(self, token, params, body, end):
+        self.token = token
+        self.params = params
+        self.body = body
+        self.end = end
+
+
+class Table(Node):
+    """
+    trailing is set when the last field is followed by a ',' or ';'
+    """
+
+    __slots__ = ("token", "fields", "end", "trailing")
+
+    def __init__(self, token, fields, end, trailing):
+        self.token = token
+        self.fields = fields
+        self.end = end
+        self.trailing = trailing
+
+
+class TableField(Node):
+    """
+    { value }, { name = value } or { [key] = value }, only one of name and key is set for the last two.
+    token is the '[' of a key
+    """
+
+    __slots__ = ("name", "token", "key", "value")
+
+    def __init__(self, name, token, key, value):
+        self.name = name
+        self.token = token
+        self.key = key
+        self.value = value
+
+
+class Field(Node):
+    """
+    a.b
+    """
+
+    __slots__ = ("value", "token", "name")
+
+    def __init__(self, value, token, name):
+        self.value = value
+        self.token = token
+        self.name = name
+
+
+class Index(Node):
+    """
+    a[b]
+    """
+
+    __slots__ = ("value", "token", "key", "end")
+
+    def __init__(self, value, token, key, end):
+        self.value = value
+        self.token = token
+        self.key = key
+        self.end = end
+
+
+class Call(Node):
+    """
+    f(args), also f"string" and f{table} with the string or table as the only argument
+    """
+
+    __slots__ = ("func", "args")
+
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+
+
+class Method(Node):
+    """
+    a:b(args)
+    """
+
+    __slots__ = ("value", "token", "name", "args")
+
+    def __init__(self, value, token, name, args):
+        self.value = value
+        self.token = token
+        self.name = name
+        self.args = args
+
+
+class Paren(Node):
+    __slots__ = ("token", "value", "end")
+
+    def __init__(self, token, value, end):
+        self.token = token
+        self.value = value
+        self.end = end
+
+
+class BinaryOp(Node):
+    __slots__ = ("left", "token", "right")
+
+    def __init__(self, left, token, right):
+        self.left = left
+        self.token = token
+        self.right = right
+
+
+class UnaryOp(Node):
+    __slots__ = ("token", "value")
+
+    def __init__(self, token, value):
+        self.token = token
+        self.value = value
+
+
+class Visitor:
+    """
+    Walks a tree, calling visit_<Node class name> for every node that has one
+    and generic_visit (every child in source order) for the rest
+    """
+
+    def visit(self, node):
+        return getattr(self, node.visit_name, self.generic_visit)(node)
+
+    def generic_visit(self, node):
+        # Children walked generically too go on a stack instead of recursing,
+        # so long chains (a .. b .. c, a.b.c:d()) are not limited by the recursion limit
+        todo = list(iter_children(node))
+        todo.reverse()
+        while todo:
+            child = todo.pop()
+            if hasattr(self, child.visit_name):
+                self.visit(child)
+            else:
+                children = list(iter_children(child))
+                children.reverse()
+                todo.extend(children)
+
+
+def iter_children(node):
+    """
+    The nodes directly under node, in source order
+    """
+
+    for name in node.__slots__:
+        yield from _nodes_in(getattr(node, name))
+
+
+def _nodes_in(value):
+    if isinstance(value, Node):
+        yield value
+    elif isinstance(value, (list, tuple)):
+        for item in value:
+            yield from _nodes_in(item)
+
+
+def parse(tokens):
+    """
+    :raises errors.ParseError: If the tokens are not a valid chunk
+    :return: Block
+    """
+
+    parser = _Parser(tokens)
+    try:
+        return parser.chunk()
+    except RecursionError:
+        line = parser.t.line
+        raise errors.ParseError("Nested too deeply on line {0}.".format(line), line) from None
+
+
+def is_name(t):
+    """
+    Tokens that can be a variable name (the Garry's Mod words are ordinary names to Lua)
+    """
+
+    return (t.kind == tokenizer.NAME or t.kind == tokenizer.INTERNAL or t.text in tokenizer.GM_WORDS)
+
+
+class _Parser:
+    """
+    Recursive descent over the token list, one token of look ahead (two for table fields)
+    """
+
+    def __init__(self, tokens):
+        line = tokens[-1].line if tokens else 1
+        self.tokens = tokens + [tokenizer.Token(END_OF_FILE, "", line)]
+        self.i = 0
+
+        # The next token, the end of file token at the end
+        self.t = self.tokens[0]
+
+    def check(self, text):
+        # Placeholders never look like a keyword or symbol
+        return self.t.text == text
+
+    def advance(self):
+        t = self.t
+        self.i += 1
+        self.t = self.tokens[self.i]
+        return t
+
+    def accept(self, text):
+        if self.t.text == text:
+            return self.advance()
+        return None
+
+    def expect(self, text, opening=None):
+        if self.t.text == text:
+            return self.advance()
+
+        if opening is not None and opening.line != self.t.line:
+            self.fail("Expected '{0}' to close the '{1}' on line {2}".format(text, opening.text, opening.line))
+        self.fail("Expected '{0}'".format(text))
+
+    def expect_name(self):
+        if not is_name(self.t):
+            self.fail("Expected a name")
+        return self.advance()
+
+    def fail(self, message):
+        t = self.t
+        if t.kind == END_OF_FILE:
+            message += ", found the end of the file."
+        else:
+            message += ", found '{0}' on line {1}.".format(t.text, t.line)
+        raise errors.ParseError(message, t.line)
+
+    def block_ends(self):
+        t = self.t
+        return t.kind == END_OF_FILE or (t.kind == tokenizer.KEYWORD and t.text in BLOCK_ENDS)
+
+    # Statements
+
+    def chunk(self):
+        body = self.block()
+        if self.t.kind != END_OF_FILE:
+            self.fail("Expected a statement")
+        return body
+
+    def block(self):
+        body = []
+        while not self.block_ends():
+            statement = self.statement()
+            if statement is not None:
+                body.append(statement)
+        return Block(body)
+
+    def statement(self):
+        t = self.t
+        text = t.text
+
+        if t.kind == tokenizer.SYMBOL:
+            if text == ";":
+                self.advance()
+                return None
+            if text == "::":
+                self.advance()
+                if self.t.kind == END_OF_FILE:
+                    self.fail("Expected a label")
+                name = self.advance()
+                self.expect("::", t)
+                return Label(t, name)
+
+        elif t.kind == tokenizer.KEYWORD and text not in tokenizer.GM_WORDS:
+            statement = getattr(self, "statement_" + text, None)
+            if statement is None:
+                self.fail("Expected a statement")
+            self.advance()
+            return statement(t)
+
+        return self.expression_statement()
+
+    def statement_local(self, t):
+        if self.check("function"):
+            function = self.advance()
+            return LocalFunction(t, self.expect_name(), self.function_body(function))
+
+        names = [self.expect_name()]
+        while self.accept(","):
+            names.append(self.expect_name())
+
+        values = self.expression_list() if self.accept("=") else []
+        return Local(t, names, values)
+
+    def statement_function(self, t):
+        target = Name(self.expect_name())
+        while self.check("."):
+            dot = self.advance()
+            target = Field(target, dot, self.expect_name())
+
+        method = False
+        if self.check(":"):
+            colon = self.advance()
+            target = Field(target, colon, self.expect_name())
+            method = True
+
+        return FunctionStatement(target, method, self.function_body(t))
+
+    def statement_return(self, t):
+        values = []
+        if not self.block_ends() and not self.check(";"):
+            values = self.expression_list()
+        return Return(t, values)
+
+    def statement_break(self, t):
+        return Break(t)
+
+    def statement_continue(self, t):
+        return Break(t)
+
+    def statement_goto(self, t):
+        if self.t.kind == END_OF_FILE:
+            self.fail("Expected a label")
+        return Goto(t, self.advance())
+
+    def statement_do(self, t):
+        body = self.block()
+        return Do(t, body, self.expect("end", t))
+
+    def statement_while(self, t):
+        condition = self.expression()
+        do = self.expect("do", t)
+        body = self.block()
+        return While(t, condition, do, body, self.expect("end", t))
+
+    def statement_repeat(self, t):
+        body = self.block()
+        until = self.expect("until", t)
+        return Repeat(t, body, until, self.expression())
+
+    def statement_if(self, t):
+        clauses = []
+        keyword = t
+        while True:
+            condition = self.expression()
+            then = self.expect("then", keyword)
+            clauses.append((keyword, condition, then, self.block()))
+
+            keyword = self.accept("elseif")
+            if keyword is None:
+                break
+
+        orelse = None
+        keyword = self.accept("else")
+        if keyword is not None:
+            orelse = (keyword, self.block())
+
+        return If(clauses, orelse, self.expect("end", t))
+
+    def statement_for(self, t):
+        first = self.expect_name()
+
+        if self.accept("="):
+            start = self.expression()
+            self.expect(",")
+            stop = self.expression()
+            step = self.expression() if self.accept(",") else None
+            do = self.expect("do", t)
+            body = self.block()
+            return NumericFor(t, first, start, stop, step, do, body, self.expect("end", t))
+
+        names = [first]
+        while self.accept(","):
+            names.append(self.expect_name())
+        self.expect("in")
+        values = self.expression_list()
+        do = self.expect("do", t)
+        body = self.block()
+        return GenericFor(t, names, values, do, body, self.expect("end", t))
+
+    def expression_statement(self):
+        value = self.suffixed_expression()
+
+        if self.check("=") or self.check(","):
+            targets = [value]
+            while self.accept(","):
+                targets.append(self.suffixed_expression())
+            for target in targets:
+                if not isinstance(target, (Name, Field, Index)):
+                    self.fail("Can not assign to an expression")
+            token = self.expect("=")
+            return Assign(targets, token, self.expression_list())
+
+        if not isinstance(value, (Call, Method)):
+            self.fail("Expected a statement")
+        return CallStatement(value)
+
+    # Expressions
+
+    def expression_list(self):
+        values = [self.expression()]
+        while self.accept(","):
+            values.append(self.expression())
+        return values
+
+    def expression(self):
+        """
+        Operator precedence without recursing on every operator:
+        the operators waiting for their right side are kept on a stack
+        """
+
+        # (operator, left side or None for a unary operator, right priority)
+        waiting = []
+        while True:
+            while True:
+                t = self.t
+                if t.kind == tokenizer.STRING or t.text not in UNARY_OPERATORS:
+                    break
+                waiting.append((self.advance(), None, UNARY_PRIORITY))
+
+            value = self.simple_expression()
+
+            t = self.t
+            priority = BINARY_PRIORITY.get(t.text) if t.kind != tokenizer.STRING else None
+
+            while waiting and (priority is None or waiting[-1][2] >= priority[0]):
+                op, left, _ = waiting.pop()
+                value = UnaryOp(op, value) if left is None else BinaryOp(left, op, value)
+
+            if priority is None:
+                return value
+            waiting.append((self.advance(), value, priority[1]))
+
+    def simple_expression(self):
+        t = self.t
+        if t.kind == tokenizer.NUMBER or t.kind == tokenizer.STRING or t.text == "..." or (
+                t.kind == tokenizer.KEYWORD and t.text in ("nil", "true", "false")):
+            return Value(self.advance())
+        if t.text == "{":
+            return self.table()
+        if t.text == "function" and t.kind == tokenizer.KEYWORD:
+            return self.function_body(self.advance())
+        return self.suffixed_expression()
+
+    def primary_expression(self):
+        t = self.t
+        if is_name(t):
+            return Name(self.advance())
+        if self.check("("):
+            self.advance()
+            value = self.expression()
+            return Paren(t, value, self.expect(")", t))
+        self.fail("Expected an expression")
+
+    def suffixed_expression(self):
+        value = self.primary_expression()
+        while True:
+            t = self.t
+            if t.kind == tokenizer.STRING or t.text == "(" or t.text == "{":
+                value = Call(value, self.call_args())
+                continue
+            if t.kind != tokenizer.SYMBOL:
+                return value
+
+            if t.text == ".":
+                self.advance()
+                value = Field(value, t, self.expect_field())
+            elif t.text == "[":
+                self.advance()
+                key = self.expression()
+                value = Index(value, t, key, self.expect("]", t))
+            elif t.text == ":":
+                self.advance()
+                name = self.expect_field()
+                value = Method(value, t, name, self.call_args())
+            else:
+                return value
+
+    def expect_field(self):
+        """
+        The name after a '.' or ':', which can be one of the words GLua reserves on top of Lua 5.1
+        """
+
+        t = self.t
+        if not (is_name(t) or t.kind == tokenizer.KEYWORD):
+            self.fail("Expected a name")
+        return self.advance()
+
+    def call_args(self):
+        t = self.t
+        if t.kind == tokenizer.STRING:
+            return [Value(self.advance())]
+        if t.text == "{":
+            return [self.table()]
+
+        opening = self.expect("(")
+        args = []
+        if not self.check(")"):
+            args = self.expression_list()
+        self.expect(")", opening)
+        return args
+
+    def function_body(self, t):
+        opening = self.expect("(")
+        params = []
+        if not self.check(")"):
+            while True:
+                if self.check("..."):
+                    params.append(self.advance())
+                    break
+                params.append(self.expect_name())
+                if not self.accept(","):
+                    break
+        self.expect(")", opening)
+
+        body = self.block()
+        return Function(t, params, body, self.expect("end", t))
+
+    def table(self):
+        opening = self.advance()
+        fields = []
+        trailing = False
+        while not self.check("}"):
+            if self.check("["):
+                bracket = self.advance()
+                key = self.expression()
+                self.expect("]", bracket)
+                self.expect("=")
+                fields.append(TableField(None, bracket, key, self.expression()))
+            elif is_name(self.t) and self.tokens[self.i + 1].text == "=":
+                name = self.advance()
+                self.advance()
+                fields.append(TableField(name, None, None, self.expression()))
+            else:
+                fields.append(TableField(None, None, None, self.expression()))
+
+            trailing = self.accept(",") is not None or self.accept(";") is not None
+            if not trailing:
+                break
+
+        return Table(opening, fields, self.expect("}", opening), trailing)
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The modules are imported by name from the repository root, like bench/bench.py does
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
@@ -0,0 +1,62 @@
+import io
+import json
+
+import pytest
+
+import api
+import errors
+import server
+
+
+def test_same_seed_same_code():
+    options = api.Options(level=3, xor=12, seed=5)
+    result = api.obfuscate_source("local a = 'x' print(a)", options)
+    assert api.obfuscate_source("local a = 'x' print(a)", options).code == result.code
+    assert result.stats.get("strip") is not None
+    assert not result.cached
+
+
+def test_unknown_level():
+    with pytest.raises(ValueError):
+        api.obfuscate_source("print(1)", api.Options(level=9))
+
+
+@pytest.mark.parametrize("lua, error, line", [
+    ("print(1)\nprint('never closed)", errors.StripError, 2),
+    ("if a then\nprint(1)\n", errors.ParseError, 2),
+])
+def test_errors_have_their_line(lua, error, line):
+    with pytest.raises(error) as e:
+        api.obfuscate_source(lua)
+    assert e.value.line == line
+
+
+def serve(*requests):
+    out = io.StringIO()
+    server.serve(io.StringIO("".join(r if isinstance(r, str) else json.dumps(r) + "\n" for r in requests)), out)
+    return [json.loads(line) for line in out.getvalue().splitlines()]
+
+
+def test_server_answers_in_order(tmp_path):
+    path = tmp_path / "in.lua"
+    path.write_text("print('file')")
+
+    responses = serve({"id": 1, "source": "print('hi')", "level": 2, "seed": 1},
+                      {"id": "two", "input": str(path), "seed": 1})
+    assert [r["id"] for r in responses] == [1, "two"]
+    assert all(r["ok"] for r in responses)
+    assert responses[0]["code"] == api.obfuscate_source("print('hi')", api.Options(level=2, seed=1)).code
+
+
+def test_server_errors():
+    responses = serve("not json\n",
+                      {"id": 2},
+                      {"id": 3, "source": "x = (1"},
+                      {"id": 4, "input": "/does/not/exist.lua"})
+    assert [(r["id"], r["ok"], r["error"]) for r in responses] == [
+        (None, False, "BadRequest"),
+        (2, False, "BadRequest"),
+        (3, False, "ParseError"),
+        (4, False, "FileNotFoundError"),
+    ]
+    assert responses[2]["line"] == 1
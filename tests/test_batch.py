@@ -0,0 +1,71 @@
+import os
+
+import batch
+import cache
+
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+        f.write(text)
+
+
+def make_tree(root):
+    write(os.path.join(root, "init.lua"), "local a = 1 print(a)")
+    write(os.path.join(root, "lib", "util.lua"), "function util(x) return x + 1 end")
+    write(os.path.join(root, "lib", "notes.txt"), "not lua")
+
+
+def run(input_dir, output_dir, **kwargs):
+    kwargs.setdefault("jobs", 1)
+    return batch.obfuscate_tree(str(input_dir), str(output_dir), 1, {"print"}, **kwargs)
+
+
+def test_find_files_is_sorted_and_filtered(tmp_path):
+    make_tree(str(tmp_path))
+    assert batch.find_files(str(tmp_path)) == ["init.lua", os.path.join("lib", "util.lua")]
+    assert batch.find_files(str(tmp_path), "*.txt") == [os.path.join("lib", "notes.txt")]
+
+
+def test_keeps_the_layout(tmp_path, capsys):
+    make_tree(str(tmp_path / "in"))
+    results = run(tmp_path / "in", tmp_path / "out")
+
+    assert all(r.ok for r in results)
+    assert len(results) == 2
+    assert (tmp_path / "out" / "init.lua").read_text()
+    assert (tmp_path / "out" / "lib" / "util.lua").read_text()
+    assert not (tmp_path / "out" / "lib" / "notes.txt").exists()
+    assert "[ OK ]" in capsys.readouterr().out
+
+
+def test_bad_file_does_not_stop_the_batch(tmp_path, capsys):
+    make_tree(str(tmp_path / "in"))
+    write(str(tmp_path / "in" / "bad.lua"), "local s = \"unterminated")
+    results = run(tmp_path / "in", tmp_path / "out")
+
+    failed = [r for r in results if not r.ok]
+    assert [os.path.basename(r.path) for r in failed] == ["bad.lua"]
+    assert failed[0].message
+    assert sum(r.ok for r in results) == 2
+    assert "[FAIL]" in capsys.readouterr().out
+
+
+def test_process_pool(tmp_path):
+    make_tree(str(tmp_path / "in"))
+    results = run(tmp_path / "in", tmp_path / "out", jobs=2)
+
+    assert sorted(os.path.basename(r.path) for r in results if r.ok) == ["init.lua", "util.lua"]
+
+
+def test_second_run_comes_from_the_cache(tmp_path):
+    make_tree(str(tmp_path / "in"))
+    output_cache = cache.OutputCache(str(tmp_path / "cache"))
+
+    first = run(tmp_path / "in", tmp_path / "out1", cache=output_cache)
+    assert not any(r.cached for r in first)
+
+    second = run(tmp_path / "in", tmp_path / "out2", cache=output_cache)
+    assert all(r.ok and r.cached for r in second)
+    for name in ("init.lua", os.path.join("lib", "util.lua")):
+        assert (tmp_path / "out2" / name).read_text() == (tmp_path / "out1" / name).read_text()
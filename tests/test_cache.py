@@ -0,0 +1,67 @@
+import io
+import os
+
+import cache
+import context
+import obfuscator
+import stringencoder
+
+LUA = "local a = 1 print(a, \"hello\")"
+
+
+def encoder():
+    return stringencoder.get_by_level(1, warn=False)
+
+
+def obfuscate(output_cache, lua=LUA, sink=None):
+    ctx = context.ObfuscationContext(seed=1, quiet=True)
+    return output_cache.obfuscate(lua, encoder(), {"print"}, xor_val=3, ctx=ctx, sink=sink)
+
+
+def test_miss_then_hit(tmp_path):
+    c = cache.OutputCache(str(tmp_path))
+    first = obfuscate(c)
+    assert (c.hits, c.misses) == (0, 1)
+
+    assert obfuscate(c) == first
+    assert (c.hits, c.misses) == (1, 1)
+
+
+def test_key_changes_with_the_input(tmp_path):
+    c = cache.OutputCache(str(tmp_path))
+    key = c.key(LUA, 1, {"print"}, 3, 1)
+    assert c.key(LUA, 1, {"print"}, 3, 1) == key
+    assert c.key(LUA + " ", 1, {"print"}, 3, 1) != key
+    assert c.key(LUA, 2, {"print"}, 3, 1) != key
+    assert c.key(LUA, 1, {"print", "x"}, 3, 1) != key
+    assert c.key(LUA, 1, {"print"}, 4, 1) != key
+    assert c.get(key) is None
+
+
+def test_evicts_least_recently_used(tmp_path):
+    c = cache.OutputCache(str(tmp_path), max_bytes=25)
+    c.put("a", "x" * 10)
+    c.put("b", "y" * 10)
+    os.utime(c._path("a"), (1, 1))
+    os.utime(c._path("b"), (2, 2))
+
+    # Over max_bytes, down to 90% of it, never the new entry
+    c.put("c", "z" * 10)
+    assert c.get("a") is None
+    assert c.get("b") == "y" * 10
+    assert c.get("c") == "z" * 10
+
+
+def test_sink_gets_the_code_when_the_entry_is_evicted(tmp_path, monkeypatch):
+    expected = obfuscator.obfuscate(LUA, encoder(), {"print"}, xor_val=3,
+                                    ctx=context.ObfuscationContext(seed=1, quiet=True))[0]
+
+    # Another process clears the cache as soon as the entry is written
+    c = cache.OutputCache(str(tmp_path), max_bytes=1)
+    other = cache.OutputCache(str(tmp_path))
+    monkeypatch.setattr(c, "evict", lambda max_bytes=None, keep=None: other.clear())
+
+    sink = io.BytesIO()
+    assert obfuscate(c, sink=sink) is None
+    assert sink.getvalue().decode("utf-8") == expected
+    assert other.size() == 0
@@ -0,0 +1,53 @@
+import io
+import os
+
+import pytest
+
+import context
+import finalize
+import obfuscator
+import stringencoder
+import tokenizer
+
+LUA = "local a = {1, 2, 3} for i = 1, #a do print(a[i] .. \"!\") end return a"
+
+
+def test_chunks_join_to_the_whole_code():
+    tokens = tokenizer.tokenize("local a = 1 return a + - 1") * 1000
+    code = finalize.finalize(tokens, "D")
+    assert "".join(finalize.iter_code(tokens, "D", chunk_size=7)) == code
+    assert code.startswith("D local a=1 return a+-1 local")
+
+
+def test_sink_gets_the_same_code():
+    encoder = stringencoder.get_by_level(2, warn=False)
+    code = obfuscator.obfuscate(LUA, encoder, {"print"}, xor_val=9, ctx=context.ObfuscationContext(seed=3, quiet=True))[0]
+
+    sink = io.BytesIO()
+    assert obfuscator.obfuscate(LUA, encoder, {"print"}, xor_val=9, ctx=context.ObfuscationContext(seed=3, quiet=True),
+                                sink=sink)[0] is None
+    assert sink.getvalue().decode("utf-8") == code
+
+
+def test_open_output_replaces_when_done(tmp_path):
+    path = str(tmp_path / "out" / "a.lua")
+    with finalize.open_output(path) as f:
+        f.write(b"new")
+        assert not os.path.exists(path)
+    with open(path, "rb") as f:
+        assert f.read() == b"new"
+
+
+def test_open_output_keeps_the_old_file_on_error(tmp_path):
+    path = str(tmp_path / "a.lua")
+    with open(path, "wb") as f:
+        f.write(b"old")
+
+    with pytest.raises(ValueError):
+        with finalize.open_output(path) as f:
+            f.write(b"half")
+            raise ValueError
+
+    with open(path, "rb") as f:
+        assert f.read() == b"old"
+    assert os.listdir(str(tmp_path)) == ["a.lua"]
@@ -0,0 +1,79 @@
+import io
+import os
+
+import api
+import cache
+import incremental
+import stringencoder
+
+LUA = """
+local function add(a, b)
+    local sum = a + b
+    return sum
+end
+print(add(1, 2), "one")
+"""
+
+ADDED = """
+local function sub(a, b)
+    local difference = a - b
+    return difference
+end
+print(sub(2, 1), "two")
+"""
+
+
+def run(lua, state):
+    return api.obfuscate_source(lua, api.Options(level=2, state=state)).code
+
+
+def test_same_source_same_output():
+    state = incremental.FileState(7, 1234)
+    first = run(LUA, state)
+    assert run(LUA, state) == first
+
+
+def test_names_kept_when_code_is_added():
+    state = incremental.FileState(7, 1234)
+    run(LUA, state)
+    names = dict(state.names)
+    slots = dict(state.slots)
+
+    run(LUA + ADDED, state)
+    assert {k: state.names[k] for k in names} == names
+    assert {k: state.slots[k] for k in slots} == slots
+
+    # The new variables got names of their own
+    assert len(set(state.names.values())) == len(state.names)
+
+
+def test_state_round_trips(tmp_path):
+    state = incremental.FileState(7, 1234)
+    first = run(LUA, state)
+
+    path = str(tmp_path / "state.json")
+    incremental.save_state(path, state)
+    assert run(LUA, incremental.load_state(path)) == first
+
+
+def test_sink_gets_the_code_when_the_entry_is_evicted(tmp_path, monkeypatch):
+    expected = run(LUA, incremental.FileState(7, 1234))
+
+    # Another process clears the cache as soon as the entry is written
+    output_cache = cache.OutputCache(str(tmp_path), max_bytes=1)
+    other = cache.OutputCache(str(tmp_path))
+    monkeypatch.setattr(output_cache, "evict", lambda max_bytes=None, keep=None: other.clear())
+
+    sink = io.BytesIO()
+    state = incremental.FileState(7, 1234)
+    assert incremental.obfuscate(LUA, stringencoder.get_by_level(2, warn=False), api.load_globals(), state,
+                                 ctx=incremental.new_context(state), cache=output_cache, sink=sink) is None
+    assert sink.getvalue().decode("utf-8") == expected
+
+
+def test_same_name_in_other_directories():
+    a = incremental.file_state_path("states", "lua/a/init.lua")
+    b = incremental.file_state_path("states", "lua/b/init.lua")
+    assert a != b
+    assert incremental.file_state_path("states", "lua/a/../a/init.lua") == a
+    assert os.path.basename(a).startswith("init.lua.")
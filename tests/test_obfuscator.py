@@ -0,0 +1,21 @@
+import api
+
+
+def obfuscate(lua):
+    return api.obfuscate_source(lua, api.Options(level=0, xor=1, seed=1)).code
+
+
+def test_labels_are_not_globals():
+    code = obfuscate("for i = 1, 3 do if i == 2 then goto skip end print(i) ::skip:: end")
+    assert "goto skip " in code
+    assert "::skip::" in code
+
+
+def test_labels_named_like_globals():
+    code = obfuscate("for i = 1, 3 do if i == 2 then goto next end print(i) ::next:: end")
+    assert "goto next " in code
+    assert "::next::" in code
+
+    code = obfuscate("for i = 1, 3 do if i == 2 then goto continue end print(i) ::continue:: end")
+    assert "goto continue " in code
+    assert "::continue::" in code
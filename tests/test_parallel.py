@@ -0,0 +1,36 @@
+import api
+import generate
+import parallel
+import tokenizer
+
+
+def test_same_as_sequential(monkeypatch):
+    # Small parts, so a small source is still cut up
+    monkeypatch.setattr(parallel, "MIN_PART_TOKENS", 500)
+    lua = generate.generate(20 * 1024)
+
+    sequential = api.obfuscate_source(lua, api.Options(level=2, xor=5, seed=1))
+    parallel_run = api.obfuscate_source(lua, api.Options(level=2, xor=5, seed=1, jobs=2))
+    assert parallel_run.code == sequential.code
+
+
+def test_split_only_between_statements(monkeypatch):
+    monkeypatch.setattr(parallel, "MIN_PART_TOKENS", 10)
+    lua = "local a = 1\n" * 20 + "function f() local b = 2 return b end\n" * 20
+    tokens = tokenizer.tokenize(lua)
+
+    parts = parallel.split(tokens, 4)
+    assert len(parts) == 4
+    assert [t for part in parts for t in part] == tokens
+    for part in parts:
+        assert part[0].text in ("local", "function")
+
+
+def test_local_functions(monkeypatch):
+    # Never cut between local and function
+    monkeypatch.setattr(parallel, "MIN_PART_TOKENS", 10)
+    lua = "".join("local function f{0}() return {0} end\n".format(n) for n in range(25))
+
+    sequential = api.obfuscate_source(lua, api.Options(level=1, xor=5, seed=1))
+    parallel_run = api.obfuscate_source(lua, api.Options(level=1, xor=5, seed=1, jobs=2))
+    assert parallel_run.code == sequential.code
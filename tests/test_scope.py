@@ -0,0 +1,59 @@
+import scope
+import stringstripper
+import tokenizer
+
+
+def bindings_of(lua):
+    """
+    name -> number of tokens (the declaration and every use) of each binding, in order
+    """
+
+    lua, strings, _ = stringstripper.strip(lua)
+    return [(b.kind, b.name, len(b.tokens)) for b in scope.resolve(tokenizer.tokenize(lua, strings))]
+
+
+def test_local():
+    assert bindings_of("local a = 1 print(a) a = a + 1") == [(scope.LOCAL, "a", 4)]
+
+
+def test_global_is_not_bound():
+    assert bindings_of("a = 1 print(a)") == []
+
+
+def test_shadowing():
+    assert bindings_of("local a = 1 do local a = 2 print(a) end print(a)") == [
+        (scope.LOCAL, "a", 2),
+        (scope.LOCAL, "a", 2),
+    ]
+
+
+def test_local_not_visible_in_its_own_value():
+    # The a after = is the outer one
+    assert bindings_of("local a = 1 do local a = a + 1 end") == [
+        (scope.LOCAL, "a", 2),
+        (scope.LOCAL, "a", 1),
+    ]
+
+
+def test_repeat_until_sees_the_block():
+    assert bindings_of("repeat local x = 1 until x == 1 print(x)") == [(scope.LOCAL, "x", 2)]
+
+
+def test_arguments_and_loops():
+    assert bindings_of("function f(a, b) for i = a, b do print(i) end end") == [
+        (scope.ARGUMENT, "a", 2),
+        (scope.ARGUMENT, "b", 2),
+        (scope.LOOP, "i", 2),
+    ]
+
+
+def test_fields_are_not_uses():
+    assert bindings_of("local a = {} print(t.a, t:a())") == [(scope.LOCAL, "a", 1)]
+
+
+def test_label_ends_local():
+    assert bindings_of("local a = 1 ::top:: a = a + 1 goto top") == [(scope.LOCAL, "a", 3)]
+
+
+def test_local_named_after_a_gm_word():
+    assert bindings_of("local GAMEMODE = GAMEMODE or GM GAMEMODE.x = 1") == [(scope.LOCAL, "GAMEMODE", 2)]
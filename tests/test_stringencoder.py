@@ -0,0 +1,51 @@
+import random
+import re
+
+import pytest
+
+import stringencoder
+
+STRINGS = ["", "hello", "It's a \"quoted\" string\n", "\\ [[ ]] \x00 \x7f", "h\xc3\xa9llo"]
+
+
+@pytest.mark.parametrize("level", [1, 2, 3, 4])
+@pytest.mark.parametrize("string", STRINGS)
+def test_same_as_every_character(level, string):
+    # One translate call gives what encoding every character on its own does,
+    # the random characters of level 3 are picked in the same order
+    encoder = stringencoder.get_by_level(level)
+    rng = random.Random(1)
+    expected = "".join(encoder.encode_char(c, 37, rng) for c in string)
+    assert encoder.encode(string, 37, random.Random(1)) == expected
+
+
+def test_seeded_strings_encode_the_same_anywhere():
+    encoder = stringencoder.get_by_level(3)
+    first = encoder.encode_all({"a": "hello", "b": "world"}, 5, seed=7)
+    second = encoder.encode_all({"c": "hello"}, 5, seed=7)
+    assert first["a"] == second["c"]
+
+
+def decode_level4(encoded, xor):
+    # What __decrypt_4.lua does: two digits per byte, then the XOR
+    values = [stringencoder.INVISIBLE_DIGITS.index(c) for c in encoded]
+    return bytes((high << 4 | low) ^ xor for high, low in zip(values[0::2], values[1::2]))
+
+
+@pytest.mark.parametrize("string", STRINGS + ["€ uses three bytes"])
+def test_level4_round_trip(string):
+    encoder = stringencoder.get_by_level(4)
+    encoded = encoder.encode(string, 200)
+    assert set(encoded) <= set(stringencoder.INVISIBLE_DIGITS)
+
+    # Characters up to 255 are one byte like in the source, the rest are their UTF-8 bytes
+    expected = bytes(ord(c) for c in string) if all(ord(c) < 256 for c in string) else string.encode("utf-8")
+    assert decode_level4(encoded, 200) == expected
+
+
+def test_level4_digits_match_the_template():
+    template = stringencoder.get_by_level(4).get_decrypt_code(0)
+    digits = {}
+    for escaped, value in re.findall(r"\['((?:\\\d+)+)'\]=(\d+)", template):
+        digits[int(value)] = bytes(int(b) for b in escaped.split("\\")[1:]).decode("utf-8")
+    assert [digits[n] for n in range(16)] == stringencoder.INVISIBLE_DIGITS
@@ -0,0 +1,51 @@
+import pytest
+
+import errors
+import stringstripper
+
+
+def test_strings_become_placeholders():
+    lua, strings, comments = stringstripper.strip("a = \"x\" b = 'y\\'z' c = [==[ ]] ]==]")
+    assert lua.split() == ["a", "=", "__STRING_0__", "b", "=", "__STRING_1__", "c", "=", "__STRING_2__"]
+    assert strings == {"__STRING_0__": "x", "__STRING_1__": "y'z", "__STRING_2__": " ]] "}
+    assert comments == []
+
+
+def test_comments_are_removed():
+    lua, strings, comments = stringstripper.strip("a = 1 -- one\n--[[ two\n]] /* three */ b = 2 // four")
+    assert lua.split() == ["a", "=", "1", "b", "=", "2"]
+    assert comments == ["-- one", "--[[ two\n]]", "/* three */", "// four"]
+
+
+def test_lines_are_kept():
+    lua, _, _ = stringstripper.strip("a = [[\n\n]] --[[\n]]\nb = 1")
+    assert lua.split("\n")[4].split() == ["b", "=", "1"]
+
+
+def test_escapes():
+    _, strings, _ = stringstripper.strip("print(\"a\\nb\\\\c\\\"\")")
+    assert strings["__STRING_0__"] == "a\nb\\c\""
+
+
+def test_not_a_span():
+    # Minus, brackets and division that start nothing
+    lua, strings, _ = stringstripper.strip("a = - -1 / b[c[1]]")
+    assert lua == "a = - -1 / b[c[1]]"
+    assert strings == {}
+
+
+@pytest.mark.parametrize("lua, line", [
+    ("a = 1\nb = \"never closed", 2),
+    ("a = 'no\nnewlines'", 1),
+    ("\n\nx = [==[ ]=]", 3),
+    ("--[[ never\nclosed", 1),
+    ("a = 1\n/* never closed", 2),
+])
+def test_unterminated(lua, line):
+    with pytest.raises(errors.StripError) as e:
+        stringstripper.strip(lua)
+    assert e.value.line == line
+
+
+def test_replace_tokens_and_text():
+    assert stringstripper.replace("a(__S__, __SS__)", {"__S__": "x", "__SS__": "y"}, "D", "<", ">") == "a(D<x>, D<y>)"
@@ -0,0 +1,87 @@
+import pytest
+
+import codegen
+import errors
+import finalize
+import stringstripper
+import syntax
+import tokenizer
+
+
+def tokens_of(lua):
+    lua, strings, _ = stringstripper.strip(lua)
+    return tokenizer.tokenize(lua, strings), strings
+
+
+def code_of(tokens):
+    return "".join(piece for pieces in finalize.iter_pieces(tokens) for piece in pieces)
+
+
+def rewrite(lua):
+    """
+    The source parsed and generated again, as code
+    """
+
+    tokens, strings = tokens_of(lua)
+    out, _ = codegen.generate(syntax.parse(tokens), strings)
+    return code_of(out)
+
+
+@pytest.mark.parametrize("lua, expected", [
+    ("function a:b(c) return self end", "a[__TABLE_a_FIELD_b__]=function (self,c)return self end"),
+    ("local function f() return f() end", "local f f=function ()return f()end"),
+    ("a:b(c)", "a[__TABLE_a_FIELD_b__](a,c)"),
+    ("f():b(1)", "__METHOD_CALL__(f(),__METHOD_b__,1)"),
+    ("x = a.b", "x=a[__TABLE_a_FIELD_b__]"),
+    ("t = { a = 1, [2] = 3, 4 }", "t={[__TABLE_KEY_a__]=1,[2]=3,4}"),
+    ("f\"s\" f{t}", "f(__STRING_0__)f({t})"),
+    ("local x = 1 + 2 * 3 ^ 2 ^ -a", "local x=1+2*3^2^-a"),
+    ("repeat local x = 1 until x", "repeat local x=1 until x"),
+    ("while a do break end", "while a do break end"),
+    ("if a then b() elseif c then d() else e() end", "if a then b()elseif c then d()else e()end"),
+    ("for k, v in pairs(t) do end", "for k,v in pairs(t)do end"),
+])
+def test_rewrite(lua, expected):
+    assert rewrite(lua) == expected
+
+
+@pytest.mark.parametrize("lua", [
+    "local a, b = 1, 2\nfunction a.b.c:d(...) return ... end",
+    "x = -a ^ -b .. c .. d or not e and f",
+    "t = { f = function(self) return self.x end; [\"k\"] = {1, 2, 3}, }",
+    "for i = 10, 1, -1 do repeat local j = i until j > 0 end",
+    "a.b[c]:d(e).f = (g)[h]",
+])
+def test_rewrite_is_stable(lua):
+    # The tokens generated parse again, and there is nothing left to rewrite in them
+    tokens, strings = tokens_of(lua)
+    once, strings = codegen.generate(syntax.parse(tokens), strings)
+    twice, _ = codegen.generate(syntax.parse(once), strings)
+    assert code_of(twice) == code_of(once)
+
+
+@pytest.mark.parametrize("lua", [
+    "local = 1",
+    "if a then",
+    "x = (1",
+    "f(",
+    "a.b",
+])
+def test_parse_error(lua):
+    tokens, _ = tokens_of(lua)
+    with pytest.raises(errors.ParseError):
+        syntax.parse(tokens)
+
+
+@pytest.mark.parametrize("suffix", [":c()", ".c", "[1]", "(1)"])
+def test_long_suffix_chain(suffix):
+    # Far past the recursion limit, Lua has no limit on these
+    tokens, strings = tokens_of("local a = b" + suffix * 3000)
+    out, _ = codegen.generate(syntax.parse(tokens), strings)
+    assert len(out) > 3000
+
+
+def test_nested_too_deeply():
+    tokens, _ = tokens_of("local f = " + "function() return " * 1000 + "1" + " end" * 1000)
+    with pytest.raises(errors.ParseError):
+        syntax.parse(tokens)
@@ -1,4 +1,5 @@
 import re
+import sys
 
 
 SPECIAL_CHARS = ['+', '-' '*', '/', '=', '^', '%',        # Math
@@ -8,7 +9,7 @@ SPECIAL_CHARS = ['+', '-' '*', '/', '=', '^', '%',        # Math
 
 SPECIAL_STRINGS = ['...', '..', '::',
                    '||', '&&',
-                   '==', '!=', '~='
+                   '==', '!=', '~=',
                    '>=', '<=',
                    '>>', '<<']
 
@@ -21,7 +22,9 @@ GM_WORDS = ['ENT', 'WEAPON', 'SWEP', 'GAMEMODE']
 
 RESERVED_WORDS = BUILTIN_WORDS + GM_WORDS
 
-TOKEN_PATTERN = re.compile(r"(\d*\.?\d+|[^\s"  # Checks for decimals with optional lead and required end ex: ".5", "0.5"
+NUMBER_PATTERN = r"0[xX][0-9a-fA-F]+|\d*\.?\d+(?:[eE][+-]?\d+)?"
+
+TOKEN_PATTERN = re.compile(r"(" + NUMBER_PATTERN + r"|[^\s"  # Checks for decimals with optional lead and required end ex: ".5", "0.5"
                            + re.escape("".join(SPECIAL_CHARS)) + r"]+|"
                            + re.escape("___sep___".join(SPECIAL_STRINGS)).replace("___sep___", "|") + r"|["
                            + re.escape("".join(SPECIAL_CHARS)) + r"])")
@@ -29,137 +32,98 @@ TOKEN_PATTERN = re.compile(r"(\d*\.?\d+|[^\s"  # Checks for decimals with option
 WORD_PATTERN = re.compile(r"^[^\s"
                           + re.escape("".join(SPECIAL_CHARS)) + r"]+$")
 
+INVISIBLE_CHAR = "\u202A"
+
 SCOPE_IN = ['do', 'then', 'function']
 SCOPE_OUT = ['end', 'elseif']  # 'elseif' because it comes with a second 'then'.
 
 
-def tokenize(lua):
-    return TOKEN_PATTERN.findall(lua)
+NUMBER_START = re.compile(r"\.?\d")
 
+# Token kinds, decided once when the source is tokenized
+NAME = "name"          # Plain variable names that may be renamed or made global
+INTERNAL = "internal"  # Words the obfuscator leaves alone: __names__ and already obfuscated names
+KEYWORD = "keyword"    # RESERVED_WORDS
+NUMBER = "number"
+STRING = "string"      # String placeholders
+SYMBOL = "symbol"
 
-def fix_functions(tokens, strings):
-    """
-        All functions called with string literals and table literals
-        will be given parenthesis
 
-        ex: print "abc" -> print("abc")
+class Token:
     """
-
-    tokens = _fix_functions_string_literals(tokens, strings)
-    tokens = _fix_functions_table_literals(tokens)
-    tokens = fix_table_semicolons(tokens)
-
-    return tokens
-
-
-def fix_table_semicolons(tokens, start_index=0, start_depth=0):
+    A single token with its kind and position (1 based) in the stripped source
     """
-        Replaces semicolons in table definitions with commas
 
-            {                           {
-                "a";       ->               "a",
-                "b"        ->               "b"
-            }                           }
-    """
-
-    depth = start_depth
-    for i in range(start_index, len(tokens)):
-        t = tokens[i]
-
-        if t == "{":
-            depth += 1
-        elif t == "}":
-            depth -= 1
-        elif t == "function":
-            # Skip ahead to the end of the function
-            end = find_function_end(tokens, i)
-            return fix_table_semicolons(tokens, end, depth)
-        elif depth > 0 and t == ";":
-            tokens[i] = ","
-
-    return tokens
+    __slots__ = ("kind", "text", "line", "column")
 
+    def __init__(self, kind, text, line=0, column=0):
+        self.kind = kind
+        self.text = text
+        self.line = line
+        self.column = column
 
-def _fix_functions_string_literals(tokens, strings, start_index=0):
-    last = None
-    for i in range(start_index, len(tokens)):
-        t = tokens[i]
+    def copy(self):
+        return Token(self.kind, self.text, self.line, self.column)
 
-        if last is None:
-            last = t
-            continue
+    def __repr__(self):
+        return "Token({0}, {1!r}, {2}:{3})".format(self.kind, self.text, self.line, self.column)
 
-        if is_word(last) and is_word(t):
-            if t in strings.keys():
-                tokens.insert(i, "(")
-                tokens.insert(i + 2, ")")
-                return _fix_functions_string_literals(tokens, strings, i)
-
-        last = t
-
-    return tokens
 
-
-def _fix_functions_table_literals(tokens, start_index=0):
-    last = None
-    for i in range(start_index, len(tokens)):
-        t = tokens[i]
-
-        if last is None:
-            last = t
-            continue
-
-        if is_word(last) and t == "{":
-            end = find_table_end(tokens, i)
-            tokens = tokens[:i] + ["("] + tokens[i:end] + [")"] + tokens[end:]
-            return _fix_functions_table_literals(tokens, end)
-
-        last = t
-
-    return tokens
-
-
-def find_table_end(tokens, start_index):
+def tokenize(lua, strings=()):
     """
-    Find the end of a table declaration where start_index is the first '{'
+    Splits the stripped source into a list of Tokens.
+    Any word found in strings is a string placeholder.
     """
 
-    depth = 0
-    for i in range(start_index, len(tokens)):
-        t = tokens[i]
-
-        if t == "{":
-            depth += 1
-        elif t == "}":
-            depth -= 1
+    tokens = []
+    append = tokens.append
+    line = 1
+    line_start = 0
+    last = 0
 
-            if depth == 0:
-                return i + 1
+    for match in TOKEN_PATTERN.finditer(lua):
+        start = match.start()
 
-    print("Fatal error occurred.", "Please check that your input is syntactically correct.", sep="\n")
-    exit(0)
+        newlines = lua.count("\n", last, start)
+        if newlines:
+            line += newlines
+            line_start = lua.rfind("\n", last, start) + 1
+        last = match.end()
 
+        text = sys.intern(match.group())
+        append(Token(classify(text, strings), text, line, start - line_start + 1))
 
-def find_function_end(tokens, start_index):
+    return tokens
 
-    depth = 0
-    for i in range(start_index, len(tokens)):
-        t = tokens[i]
 
-        if t in SCOPE_IN:
-            depth += 1
-        elif t in SCOPE_OUT:
-            depth -= 1
+def classify(text, strings=()):
+    if text in strings:
+        return STRING
+    if text in RESERVED_WORDS:
+        return KEYWORD
+    if NUMBER_START.match(text) is not None:
+        return NUMBER
+    if WORD_PATTERN.match(text) is None:
+        return SYMBOL
+    if text[:2] == "__" or text[-2:] == "__" or INVISIBLE_CHAR in text:
+        return INTERNAL
+    return NAME
 
-            if depth == 0:
-                return i + 1
 
-    return start_index
+def is_variable(t):
+    """
+    Tokens a variable can be named: names, and the Garry's Mod words, which are ordinary names to Lua.
+    Never INTERNAL tokens.
+    """
 
+    return t.kind == NAME or (t.kind == KEYWORD and t.text in GM_WORDS)
 
-def is_word(s):
-    return s is not None and s not in RESERVED_WORDS and WORD_PATTERN.match(s) is not None and not is_number(s)
 
+def token(text, kind=SYMBOL, near=None):
+    """
+    Creates a new token, placed at the position of near
+    """
 
-def is_number(s):
-    return s.isdigit()
\ No newline at end of file
+    if near is None:
+        return Token(kind, text)
+    return Token(kind, text, near.line, near.column)